@@ -0,0 +1,257 @@
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from index_cache import file_hash
+from pipeline import (
+    cleaning_report,
+    describe_errors,
+    domain_prompts,
+    generation_order,
+    load_or_build_index,
+    query_domain,
+    rate_limiters,
+    repair_domain,
+    tracer,
+    usage_ledger,
+    validate_domain,
+)
+from trace_context import trace_tags
+
+bco_domain_keys = {domain: f"{domain}_domain" for domain in domain_prompts}
+
+
+def collect_inputs(source: str) -> list:
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, name)
+            for name in os.listdir(source)
+            if name.lower().endswith(".pdf")
+        )
+
+    # Manifests are either a JSON list of paths or one path per line, relative
+    # to the manifest's own directory.
+    with open(source) as f:
+        if source.endswith(".json"):
+            paths = json.load(f)
+        else:
+            paths = [
+                line.strip()
+                for line in f
+                if line.strip() and not line.lstrip().startswith("#")
+            ]
+    base_directory = os.path.dirname(os.path.abspath(source))
+    return [os.path.join(base_directory, path) for path in paths]
+
+
+def output_path(output_directory: str, pdf_path: str, content_hash: str) -> str:
+    # Papers in different directories can share a file name, so the content
+    # hash keeps their outputs apart.
+    stem = os.path.splitext(os.path.basename(pdf_path))[0]
+    return os.path.join(output_directory, f"{stem}-{content_hash[:12]}.json")
+
+
+def load_existing(path: str, content_hash: str):
+    try:
+        with open(path) as f:
+            bco = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # A paper that changed since the last run starts over.
+    if bco.get("content_hash") != content_hash:
+        return None
+    return bco
+
+
+def write_atomic(path: str, data: dict):
+    descriptor, temp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path) or ".", suffix=".tmp"
+    )
+    try:
+        with os.fdopen(descriptor, "w") as f:
+            json.dump(data, f, indent=2)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def process_paper(pdf_path: str, output_directory: str) -> dict:
+    started = time.monotonic()
+    content_hash = file_hash(pdf_path)
+    path = output_path(output_directory, pdf_path, content_hash)
+    bco = load_existing(path, content_hash) or {
+        "source": os.path.abspath(pdf_path),
+        "content_hash": content_hash,
+        "errors": {},
+    }
+
+    missing = [domain for domain in domain_prompts if bco_domain_keys[domain] not in bco]
+    if not missing:
+        return {"path": pdf_path, "status": "skipped", "latency": 0.0}
+
+    key, index = load_or_build_index(pdf_path, content_hash)
+    for domain in generation_order(missing):
+        try:
+            query_response, _, cache_key = query_domain(index, domain, key)
+        except Exception as e:
+            bco["errors"][domain] = str(e)
+            continue
+
+        try:
+            data, errors, _ = repair_domain(
+                index, domain, query_response, key, cache_key
+            )
+        except Exception as e:
+            data, errors = validate_domain(domain, query_response)
+            errors = errors + [{"path": (), "message": f"could not be repaired ({e})"}]
+        with tracer.span("postprocess", document=key, domain=domain):
+            # Keep the paid for response even if it is still invalid, so a
+            # resumed run doesn't redo it.
+            bco[bco_domain_keys[domain]] = query_response if data is None else data
+            if errors:
+                bco["errors"][domain] = describe_errors(errors)
+            else:
+                bco["errors"].pop(domain, None)
+            write_atomic(path, bco)
+
+    write_atomic(path, bco)
+    failed = [
+        domain for domain in domain_prompts if bco_domain_keys[domain] not in bco
+    ]
+    return {
+        "path": pdf_path,
+        "status": "partial" if failed else "complete",
+        "latency": time.monotonic() - started,
+        "document": key,
+        "cleaning": cleaning_report(key),
+    }
+
+
+def percentile(values: list, fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(
+    results: list, wall_time: float, usage: dict, paper_costs: dict, repair_usage: dict
+) -> dict:
+    latencies = [
+        result["latency"] for result in results if result["status"] != "skipped"
+    ]
+    statuses = [result["status"] for result in results]
+    processed = len(latencies)
+    return {
+        "papers": len(results),
+        "complete": statuses.count("complete"),
+        "partial": statuses.count("partial"),
+        "failed": statuses.count("failed"),
+        "skipped": statuses.count("skipped"),
+        "wall_time_seconds": round(wall_time, 2),
+        "papers_per_hour": round(processed / wall_time * 3600, 2) if wall_time else 0.0,
+        "latency_seconds": {
+            "p50": round(percentile(latencies, 0.5), 2),
+            "p95": round(percentile(latencies, 0.95), 2),
+            "max": round(max(latencies, default=0.0), 2),
+        },
+        "prompt_tokens": usage["prompt_tokens"],
+        "completion_tokens": usage["completion_tokens"],
+        "embedding_tokens": usage["embedding_tokens"],
+        "cached_embedding_tokens": usage["cached_embedding_tokens"],
+        "schema_repair": repair_usage,
+        "cleaning": {
+            result["path"]: result["cleaning"]
+            for result in results
+            if result.get("cleaning")
+        },
+        "rate_limits": {
+            endpoint.strip("/"): dict(limiter.stats, concurrency=int(limiter.concurrency.limit))
+            for endpoint, limiter in rate_limiters.items()
+        },
+        "cost": round(usage["cost"], 4),
+        "cost_per_paper": {
+            result["path"]: round(paper_costs.get(result["document"], 0.0), 4)
+            for result in results
+            if "document" in result
+        },
+    }
+
+
+def run(pdf_paths: list, output_directory: str, workers: int) -> dict:
+    os.makedirs(output_directory, exist_ok=True)
+    # Every ledger row written by this run carries the same session tag.
+    session = f"batch-{int(time.time())}-{os.getpid()}"
+    started = time.monotonic()
+    results = []
+
+    def process(pdf_path: str) -> dict:
+        with trace_tags(session=session):
+            return process_paper(pdf_path, output_directory)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(process, pdf_path): pdf_path for pdf_path in pdf_paths}
+        for future in as_completed(futures):
+            pdf_path = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {"path": pdf_path, "status": "failed", "latency": 0.0}
+                print(f"[failed] {pdf_path}: {e}", file=sys.stderr)
+            else:
+                print(f"[{result['status']}] {pdf_path} ({result['latency']:.1f}s)")
+            results.append(result)
+
+    usage = usage_ledger.totals(session=session)
+    paper_costs = {
+        row["document"]: row["cost"]
+        for row in usage_ledger.aggregate(("document",), session=session)
+    }
+    repair = usage_ledger.totals(session=session, kind="llm_repair")
+    repair_usage = {
+        "prompt_tokens": repair["prompt_tokens"],
+        "completion_tokens": repair["completion_tokens"],
+        "cost": round(repair["cost"], 4),
+        "seconds": round(
+            sum(
+                span["duration"]
+                for span in tracer.spans(stage="schema_repair", session=session)
+            ),
+            2,
+        ),
+    }
+    return summarize(
+        results, time.monotonic() - started, usage, paper_costs, repair_usage
+    )
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Generate complete BioCompute Objects for a batch of PDFs."
+    )
+    parser.add_argument(
+        "source", help="Directory of PDFs, or a manifest (.json list or one path per line)."
+    )
+    parser.add_argument("-o", "--output-dir", default="./bco_output/")
+    parser.add_argument("-w", "--workers", type=int, default=4)
+    parser.add_argument("--trace", help="Write per-stage timing spans as JSON lines.")
+    args = parser.parse_args(argv)
+
+    pdf_paths = collect_inputs(args.source)
+    summary = run(pdf_paths, args.output_dir, args.workers)
+    write_atomic(os.path.join(args.output_dir, "batch_summary.json"), summary)
+    print(json.dumps(summary, indent=2))
+    if args.trace:
+        with open(args.trace, "w") as f:
+            f.write(tracer.to_jsonl())
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,366 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from typing import Any, List
+
+import numpy as np
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.llms import (
+    CompletionResponse,
+    CompletionResponseGen,
+    CustomLLM,
+    LLMMetadata,
+)
+from llama_index.core.llms.callbacks import llm_completion_callback
+
+# The pipeline and the cache modules read these paths when imported, so they
+# are only imported inside scratch_caches().
+scratch_paths = [
+    ("INDEX_CACHE_DIR", "index_cache"),
+    ("PAGE_CACHE_DIR", "page_cache"),
+    ("EMBEDDING_CACHE_PATH", "embedding_cache.sqlite3"),
+    ("RESPONSE_CACHE_PATH", "response_cache.sqlite3"),
+    ("LEDGER_PATH", "usage_ledger.sqlite3"),
+    ("INDEX_BUNDLE_DIR", "index_bundles"),
+]
+default_corpus_directory = "./bench/corpus/"
+default_corpus_pages = [4, 24, 120]
+regression_metrics = [
+    "index_seconds",
+    "domain_seconds",
+    "embedding_calls",
+    "prompt_tokens",
+    "completion_tokens",
+    "peak_rss_mb",
+]
+
+
+class SimulatedEmbedding(BaseEmbedding):
+    """Deterministic stand-in for OpenAIEmbedding with simulated latency."""
+
+    dimensions: int = 256
+    call_latency: float = 0.05
+    tokens_per_second: float = 200000.0
+
+    _calls: int = PrivateAttr(default=0)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "SimulatedEmbedding"
+
+    @property
+    def calls(self) -> int:
+        return self._calls
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode("utf-8")).digest()[:8], "big")
+        return np.random.default_rng(seed).standard_normal(self.dimensions).tolist()
+
+    def _wait(self, texts: List[str]):
+        self._calls += 1
+        tokens = sum(len(text) // 4 for text in texts)
+        time.sleep(self.call_latency + tokens / self.tokens_per_second)
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self._wait(texts)
+        return [self._vector(text) for text in texts]
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embeddings([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_query_embedding(query)
+
+
+class SimulatedLLM(CustomLLM):
+    """Deterministic stand-in for the OpenAI LLM with simulated latency."""
+
+    first_token_latency: float = 0.5
+    tokens_per_second: float = 60.0
+    completion_words: int = 300
+
+    @property
+    def metadata(self) -> LLMMetadata:
+        return LLMMetadata(
+            context_window=128000, num_output=4096, model_name="simulated-llm"
+        )
+
+    def _words(self, prompt: str) -> List[str]:
+        rng = random.Random(hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+        return [f"word{rng.randrange(1000)}" for _ in range(self.completion_words)]
+
+    @llm_completion_callback()
+    def complete(self, prompt: str, formatted: bool = False, **kwargs: Any) -> CompletionResponse:
+        words = self._words(prompt)
+        time.sleep(self.first_token_latency + len(words) / self.tokens_per_second)
+        return CompletionResponse(text=json.dumps({"simulated": " ".join(words)}))
+
+    @llm_completion_callback()
+    def stream_complete(
+        self, prompt: str, formatted: bool = False, **kwargs: Any
+    ) -> CompletionResponseGen:
+        words = self._words(prompt)
+
+        def generate() -> CompletionResponseGen:
+            time.sleep(self.first_token_latency)
+            text = ""
+            for word in words:
+                time.sleep(1 / self.tokens_per_second)
+                delta = f"{word} "
+                text += delta
+                yield CompletionResponse(text=text, delta=delta)
+
+        return generate()
+
+
+@contextmanager
+def scratch_caches():
+    """Points every cache at a throwaway directory, so each run measures cold
+    work, and removes it afterwards."""
+    directory = tempfile.mkdtemp(prefix="bco-benchmark-")
+    previous = {variable: os.environ.get(variable) for variable, _ in scratch_paths}
+    for variable, name in scratch_paths:
+        os.environ[variable] = os.path.join(directory, name)
+    try:
+        yield directory
+    finally:
+        for variable, value in previous.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def use_simulated_models(embedding: SimulatedEmbedding, llm: SimulatedLLM):
+    import pipeline
+    from embedding_cache import CachedEmbedding
+
+    pipeline.embed_model = CachedEmbedding(embedding, tokenizer=pipeline.tokenizer)
+    pipeline.retrieval_embedding.cache_clear()
+    Settings.embed_model = pipeline.embed_model
+    Settings.llm = llm
+
+
+def pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_text_pdf(path: str, pages: List[List[str]]):
+    # Minimal single-font PDF writer so the corpus needs no extra dependency.
+    objects = [
+        b"<< /Type /Catalog /Pages 2 0 R >>",
+        None,
+        b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>",
+    ]
+    page_ids = []
+    for lines in pages:
+        stream = "BT /F1 10 Tf 14 TL 72 760 Td " + " ".join(
+            f"({pdf_escape(line)}) '" for line in lines
+        ) + " ET"
+        stream_bytes = stream.encode("latin-1")
+        objects.append(
+            b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream_bytes), stream_bytes)
+        )
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[1] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+
+    output = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(output))
+        output += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref_offset = len(output)
+    output += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        output += b"%010d 00000 n \n" % offset
+    output += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1,
+        xref_offset,
+    )
+    with open(path, "wb") as f:
+        f.write(output)
+
+
+def synthetic_pages(page_count: int, seed: int) -> List[List[str]]:
+    rng = random.Random(seed)
+    vocabulary = [
+        "samples", "reads", "aligned", "reference", "genome", "GRCh38", "variants",
+        "pipeline", "samtools", "quality", "filtered", "coverage", "expression",
+        "analysis", "parameters", "threshold", "results", "method", "dataset",
+        "accession", "software", "version", "error", "rate", "sequencing",
+    ]
+    return [
+        [
+            " ".join(rng.choice(vocabulary) for _ in range(12)).capitalize() + "."
+            for _ in range(48)
+        ]
+        for _ in range(page_count)
+    ]
+
+
+def ensure_corpus(directory: str) -> List[str]:
+    os.makedirs(directory, exist_ok=True)
+    paths = []
+    for page_count in default_corpus_pages:
+        path = os.path.join(directory, f"synthetic-{page_count:03d}-pages.pdf")
+        if not os.path.exists(path):
+            write_text_pdf(path, synthetic_pages(page_count, seed=page_count))
+        paths.append(path)
+    return paths
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is reported in kilobytes on Linux.
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+
+def llm_tokens() -> tuple:
+    import pipeline
+
+    # The ledger is in the scratch directory, so it only holds this run.
+    usage = pipeline.usage_ledger.totals(kind="llm")
+    return usage["prompt_tokens"], usage["completion_tokens"]
+
+
+def embedding_tokens() -> int:
+    import pipeline
+
+    return pipeline.usage_ledger.totals(kind="embedding")["embedding_tokens"]
+
+
+def benchmark_document(path: str, embedding: SimulatedEmbedding) -> dict:
+    import pipeline
+    from index_cache import file_hash
+
+    content_hash = file_hash(path)
+    calls_before = embedding.calls
+    embed_tokens_before = embedding_tokens()
+    started = time.perf_counter()
+    index = pipeline.build_index(path, content_hash)
+    result = {
+        "name": os.path.basename(path),
+        "index_seconds": round(time.perf_counter() - started, 3),
+        "embedding_calls": embedding.calls - calls_before,
+        "embedding_tokens": embedding_tokens() - embed_tokens_before,
+        "domains": {},
+    }
+
+    for domain in pipeline.domain_prompts:
+        prompt_before, completion_before = llm_tokens()
+        started = time.perf_counter()
+        pipeline.query_domain(index, domain)
+        prompt_after, completion_after = llm_tokens()
+        result["domains"][domain] = {
+            "seconds": round(time.perf_counter() - started, 3),
+            "prompt_tokens": prompt_after - prompt_before,
+            "completion_tokens": completion_after - completion_before,
+        }
+    return result
+
+
+def totals(documents: List[dict], peak_rss: float) -> dict:
+    domains = [domain for document in documents for domain in document["domains"].values()]
+    return {
+        "index_seconds": round(sum(document["index_seconds"] for document in documents), 3),
+        "domain_seconds": round(sum(domain["seconds"] for domain in domains), 3),
+        "embedding_calls": sum(document["embedding_calls"] for document in documents),
+        "embedding_tokens": sum(document["embedding_tokens"] for document in documents),
+        "prompt_tokens": sum(domain["prompt_tokens"] for domain in domains),
+        "completion_tokens": sum(domain["completion_tokens"] for domain in domains),
+        "peak_rss_mb": peak_rss,
+    }
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> List[str]:
+    regressions = []
+    for metric in regression_metrics:
+        old = baseline["totals"].get(metric)
+        new = results["totals"].get(metric)
+        if old and new is not None and new > old * (1 + tolerance):
+            regressions.append(f"{metric}: {old} -> {new} (+{(new / old - 1):.0%})")
+    return regressions
+
+
+def run(args) -> dict:
+    embedding = SimulatedEmbedding(call_latency=args.embed_latency)
+    llm = SimulatedLLM(
+        first_token_latency=args.llm_latency,
+        tokens_per_second=args.llm_tokens_per_second,
+        completion_words=args.completion_words,
+    )
+    use_simulated_models(embedding, llm)
+
+    if args.corpus:
+        paths = sorted(
+            os.path.join(args.corpus, name)
+            for name in os.listdir(args.corpus)
+            if name.lower().endswith(".pdf")
+        )
+    else:
+        paths = ensure_corpus(default_corpus_directory)
+
+    documents = [benchmark_document(path, embedding) for path in paths]
+    return {
+        "created": time.time(),
+        "config": vars(args),
+        "documents": documents,
+        "totals": totals(documents, peak_rss_mb()),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmark indexing and domain generation with simulated models."
+    )
+    parser.add_argument(
+        "--corpus", help="Directory of PDFs. Defaults to a generated synthetic corpus."
+    )
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against.")
+    parser.add_argument("--tolerance", type=float, default=0.10)
+    parser.add_argument("--embed-latency", type=float, default=0.05)
+    parser.add_argument("--llm-latency", type=float, default=0.5)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=60.0)
+    parser.add_argument("--completion-words", type=int, default=300)
+    args = parser.parse_args(argv)
+    os.environ.setdefault("OPENAI_API_KEY", "sk-benchmark-not-used")
+
+    with scratch_caches():
+        results = run(args)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(json.dumps(results["totals"], indent=2))
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import math
+import re
+from collections import Counter
+from typing import List
+
+import numpy as np
+
+# Keeps identifiers like "GRCh38", "samtools", "1.9" and "reads.fastq.gz"
+# whole, then also indexes the pieces of dotted or dashed names.
+token_pattern = re.compile(r"[A-Za-z0-9](?:[A-Za-z0-9_.\-]*[A-Za-z0-9])?")
+piece_pattern = re.compile(r"[._\-]")
+
+
+def tokenize(text: str) -> List[str]:
+    tokens = []
+    for token in token_pattern.findall(text.lower()):
+        tokens.append(token)
+        pieces = [piece for piece in piece_pattern.split(token) if piece]
+        if len(pieces) > 1:
+            tokens += pieces
+    return tokens
+
+
+class BM25Index:
+    """Okapi BM25 over a list of rows, kept in the same order as the vector
+    store's rows so both can share its filters."""
+
+    def __init__(self, rows: List[dict] = None, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.rows = rows or []
+        self._postings = None
+
+    def add(self, texts: List[str]):
+        self.rows += [dict(Counter(tokenize(text))) for text in texts]
+        self._postings = None
+
+    def keep(self, positions: List[int]):
+        self.rows = [self.rows[position] for position in positions]
+        self._postings = None
+
+    def _build(self):
+        postings = {}
+        for position, row in enumerate(self.rows):
+            for term, count in row.items():
+                postings.setdefault(term, []).append((position, count))
+        self._lengths = np.array([sum(row.values()) for row in self.rows], dtype=np.float32)
+        self._postings = postings
+
+    def scores(self, query: str) -> np.ndarray:
+        if self._postings is None:
+            self._build()
+        scores = np.zeros(len(self.rows), dtype=np.float32)
+        if not self.rows:
+            return scores
+        average_length = float(self._lengths.mean()) or 1.0
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (len(self.rows) - len(postings) + 0.5) / (len(postings) + 0.5))
+            positions = np.fromiter((position for position, _ in postings), np.int64)
+            counts = np.fromiter((count for _, count in postings), np.float32)
+            norms = self.k1 * (1 - self.b + self.b * self._lengths[positions] / average_length)
+            scores[positions] += idf * counts * (self.k1 + 1) / (counts + norms)
+        return scores
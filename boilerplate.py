@@ -0,0 +1,139 @@
+import hashlib
+import os
+import re
+from collections import Counter
+from typing import Callable, List
+
+import numpy as np
+from llama_index.core import Document
+from llama_index.core.schema import BaseNode, MetadataMode
+
+# Headers and footers are looked for among the first and last few lines of a
+# page, and count as boilerplate once they recur on this share of pages.
+edge_lines = int(os.getenv("BOILERPLATE_EDGE_LINES", "3"))
+repeat_fraction = float(os.getenv("BOILERPLATE_REPEAT_FRACTION", "0.3"))
+min_repeat_pages = 3
+# Chunks whose SimHashes differ in at most this many of 64 bits are treated
+# as the same text, e.g. a figure caption extracted twice.
+near_duplicate_bits = int(os.getenv("NEAR_DUPLICATE_BITS", "3"))
+near_duplicate_min_words = 20
+
+boilerplate_patterns = [
+    re.compile(pattern, re.IGNORECASE)
+    for pattern in (
+        r"^\s*(©|\(c\)\s|copyright\b)",
+        r"\ball rights reserved\b",
+        r"^\s*downloaded from\s",
+        r"^\s*this (article|work) is licen[sc]ed under\b",
+    )
+]
+# Only dropped at a page's edges, where they are page numbers. Elsewhere a
+# bare number may be a table cell.
+page_number_pattern = re.compile(r"^\s*(page\s+)?\d{1,4}(\s+of\s+\d{1,4})?\s*$", re.IGNORECASE)
+
+
+def normalize_line(line: str) -> str:
+    # Page numbers and dates inside running headers change from page to page.
+    return " ".join(re.sub(r"\d+", "#", line.lower()).split())
+
+
+def simhash(text: str) -> int:
+    words = text.lower().split()
+    shingles = [" ".join(words[start : start + 3]) for start in range(max(1, len(words) - 2))]
+    hashes = np.array(
+        [
+            int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+            for shingle in shingles
+        ],
+        dtype=np.uint64,
+    )
+    bits = np.unpackbits(hashes.byteswap().view(np.uint8).reshape(-1, 8), axis=1)
+    weights = (2 * bits.astype(np.int32) - 1).sum(axis=0)
+    return int("".join("1" if weight > 0 else "0" for weight in weights), 2)
+
+
+class DocumentCleaner:
+    """Strips boilerplate from a paper's pages before chunking, and drops
+    duplicate and near-duplicate chunks before embedding.
+
+    Pages and chunks are passed in batches as the index is built, so lines
+    are only recognised as repeated once enough pages have been seen.
+    ``report`` counts what was removed and the tokens not embedded.
+    """
+
+    def __init__(self, count_tokens: Callable[[str], int]):
+        self.count_tokens = count_tokens
+        self.report = {"lines_removed": 0, "chunks_removed": 0, "tokens_saved": 0}
+        self._edge_lines = Counter()
+        self._pages = 0
+        self._hashes = set()
+        self._fingerprints = []
+
+    def _repeated(self, normalized: str) -> bool:
+        # Relative to the pages seen so far, not the whole file, so a long
+        # supplement's headers are caught from its first batch on.
+        threshold = max(min_repeat_pages, repeat_fraction * self._pages)
+        return self._edge_lines[normalized] >= threshold
+
+    def clean_pages(self, documents: List[Document]) -> List[Document]:
+        page_lines = []
+        for document in documents:
+            lines = document.text.splitlines()
+            content = [position for position, line in enumerate(lines) if line.strip()]
+            edges = set(content[:edge_lines] + content[-edge_lines:])
+            self._edge_lines.update(
+                {normalize_line(lines[position]) for position in edges}
+            )
+            self._pages += 1
+            page_lines.append((lines, edges))
+
+        for document, (lines, edges) in zip(documents, page_lines):
+            kept = []
+            removed = []
+            for position, line in enumerate(lines):
+                if line.strip() and (
+                    any(pattern.search(line) for pattern in boilerplate_patterns)
+                    or (
+                        position in edges
+                        and (
+                            page_number_pattern.match(line)
+                            or self._repeated(normalize_line(line))
+                        )
+                    )
+                ):
+                    removed.append(line)
+                else:
+                    kept.append(line)
+            if removed:
+                document.text = "\n".join(kept)
+                self.report["lines_removed"] += len(removed)
+                self.report["tokens_saved"] += self.count_tokens("\n".join(removed))
+        return documents
+
+    def _duplicate(self, text: str) -> bool:
+        digest = hashlib.sha1(" ".join(text.lower().split()).encode("utf-8")).digest()
+        if digest in self._hashes:
+            return True
+        self._hashes.add(digest)
+        if len(text.split()) < near_duplicate_min_words:
+            return False
+        fingerprint = simhash(text)
+        if any(
+            bin(fingerprint ^ other).count("1") <= near_duplicate_bits
+            for other in self._fingerprints
+        ):
+            return True
+        self._fingerprints.append(fingerprint)
+        return False
+
+    def dedupe_nodes(self, nodes: List[BaseNode]) -> List[BaseNode]:
+        kept = []
+        for node in nodes:
+            if self._duplicate(node.get_content(metadata_mode=MetadataMode.NONE)):
+                self.report["chunks_removed"] += 1
+                self.report["tokens_saved"] += self.count_tokens(
+                    node.get_content(metadata_mode=MetadataMode.EMBED)
+                )
+            else:
+                kept.append(node)
+        return kept
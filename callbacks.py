@@ -0,0 +1,160 @@
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from llama_index.core.callbacks.base_handler import BaseCallbackHandler
+from llama_index.core.callbacks.schema import CBEventType, EventPayload
+from llama_index.core.callbacks.token_counting import get_llm_token_counts
+from llama_index.core.utilities.token_counting import TokenCounter
+
+from embedding_cache import pop_batch_stats
+from ledger import UsageLedger
+from trace_context import current_tags
+from tracing import LatencyTracer
+
+# Kept out of tracing.py and ledger.py, so the app can read spans and usage
+# before llama-index is loaded.
+stage_names = {
+    CBEventType.CHUNKING: "chunking",
+    CBEventType.EMBEDDING: "embedding_batch",
+    CBEventType.RETRIEVE: "retrieval",
+    CBEventType.LLM: "synthesis_llm",
+    CBEventType.SYNTHESIZE: "synthesis",
+    CBEventType.QUERY: "query",
+}
+
+
+class TracingHandler(BaseCallbackHandler):
+    """Callback handler recording a tracer span per pipeline stage."""
+
+    def __init__(self, tracer: LatencyTracer):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self.tracer = tracer
+        self._lock = threading.Lock()
+        self._open: Dict[str, tuple] = {}
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        if event_type in stage_names:
+            with self._lock:
+                self._open[event_id] = (event_type, time.time(), time.perf_counter(), current_tags())
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        with self._lock:
+            opened = self._open.pop(event_id, None)
+        if opened is None:
+            return
+        _, started_at, started, tags = opened
+        self.tracer.record(stage_names[event_type], time.perf_counter() - started, started_at, **tags)
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(
+        self,
+        trace_id: Optional[str] = None,
+        trace_map: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        pass
+
+
+class LedgerHandler(BaseCallbackHandler):
+    """Callback handler writing the exact token usage of each LLM call and
+    embedding batch to the ledger, tagged with the current trace tags."""
+
+    def __init__(
+        self,
+        ledger: UsageLedger,
+        tokenizer: Callable,
+        default_llm_model: str,
+        default_embed_model: str,
+    ):
+        super().__init__(event_starts_to_ignore=[], event_ends_to_ignore=[])
+        self.ledger = ledger
+        self._token_counter = TokenCounter(tokenizer=tokenizer)
+        self._default_models = {
+            CBEventType.LLM: default_llm_model,
+            CBEventType.EMBEDDING: default_embed_model,
+        }
+        self._models: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def on_event_start(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        parent_id: str = "",
+        **kwargs: Any,
+    ) -> str:
+        if event_type in self._default_models:
+            serialized = (payload or {}).get(EventPayload.SERIALIZED) or {}
+            model = (
+                serialized.get("model")
+                or serialized.get("model_name")
+                or self._default_models[event_type]
+            )
+            with self._lock:
+                self._models[event_id] = model
+        return event_id
+
+    def on_event_end(
+        self,
+        event_type: CBEventType,
+        payload: Optional[Dict[str, Any]] = None,
+        event_id: str = "",
+        **kwargs: Any,
+    ) -> None:
+        if event_type not in self._default_models or payload is None:
+            return
+        with self._lock:
+            model = self._models.pop(event_id, self._default_models[event_type])
+
+        if event_type == CBEventType.LLM:
+            try:
+                counts = get_llm_token_counts(self._token_counter, payload, event_id)
+            except ValueError:
+                return
+            # Schema repair calls are tagged so they can be reported apart.
+            self.ledger.record(
+                current_tags().get("usage_kind", "llm"),
+                model,
+                prompt_tokens=counts.prompt_token_count,
+                completion_tokens=counts.completion_token_count,
+            )
+        else:
+            batch = pop_batch_stats()
+            self.ledger.record(
+                "embedding",
+                model,
+                embedding_tokens=sum(
+                    self._token_counter.get_string_tokens(chunk)
+                    for chunk in payload.get(EventPayload.CHUNKS, [])
+                ),
+                cached_embedding_tokens=batch["cached_tokens"],
+                cached_chunks=batch["hits"],
+                embedded_chunks=batch["misses"],
+            )
+
+    def start_trace(self, trace_id: Optional[str] = None) -> None:
+        pass
+
+    def end_trace(
+        self,
+        trace_id: Optional[str] = None,
+        trace_map: Optional[Dict[str, List[str]]] = None,
+    ) -> None:
+        pass
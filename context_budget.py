@@ -0,0 +1,53 @@
+from typing import Callable, List, Optional
+
+from llama_index.core.schema import MetadataMode, NodeWithScore
+
+
+def select_context(
+    results: List[NodeWithScore],
+    budget: int,
+    score_cutoff: Optional[float],
+    allow_refine: bool,
+    count_tokens: Callable[[str], int],
+) -> dict:
+    """Chooses a domain's context from its ranked retrieval results.
+
+    Results scoring below ``score_cutoff`` times the best score are dropped,
+    so the count adapts to how clearly the paper answers the domain. Pass
+    None for scores that aren't similarities, such as fused ranks. If the
+    rest fit in ``budget`` tokens they go in one compact call. Otherwise they
+    are either all kept and refined across several calls, if
+    ``allow_refine``, or cut at the budget.
+
+    Returns ``{"nodes", "mode", "context_tokens"}``.
+    """
+    if not results:
+        return {"nodes": [], "mode": "compact", "context_tokens": 0}
+    best = results[0].score
+    kept = [
+        result
+        for result in results
+        # A non-positive best similarity can't anchor a ratio.
+        if score_cutoff is None
+        or not best
+        or best <= 0
+        or (result.score or 0) >= best * score_cutoff
+    ]
+    tokens = [
+        count_tokens(result.node.get_content(metadata_mode=MetadataMode.LLM))
+        for result in kept
+    ]
+    if sum(tokens) <= budget:
+        return {"nodes": kept, "mode": "compact", "context_tokens": sum(tokens)}
+    if allow_refine:
+        return {"nodes": kept, "mode": "refine", "context_tokens": sum(tokens)}
+
+    packed = []
+    used = 0
+    for result, result_tokens in zip(kept, tokens):
+        # The best result always goes in, even if it alone is over budget.
+        if packed and used + result_tokens > budget:
+            break
+        packed.append(result)
+        used += result_tokens
+    return {"nodes": packed, "mode": "compact", "context_tokens": used}
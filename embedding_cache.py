@@ -0,0 +1,211 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from array import array
+from typing import Any, Callable, List, Optional
+
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import PrivateAttr
+
+embedding_cache_path = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.sqlite3")
+# OpenAI's per request limits for the embeddings endpoint.
+max_batch_inputs = int(os.getenv("EMBED_MAX_BATCH_INPUTS", "2048"))
+max_batch_tokens = int(os.getenv("EMBED_MAX_BATCH_TOKENS", "300000"))
+
+# Per thread totals for the batch currently being embedded, so callback
+# handlers can tell billed tokens from cached ones for the same event.
+_batch_stats = threading.local()
+
+
+def pop_batch_stats() -> dict:
+    stats = getattr(_batch_stats, "stats", None) or {
+        "hits": 0,
+        "misses": 0,
+        "cached_tokens": 0,
+    }
+    _batch_stats.stats = None
+    return stats
+
+
+def normalize_text(text: str) -> str:
+    return " ".join(text.split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingStore:
+
+    def __init__(self, path: str = embedding_cache_path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        # WAL lets several server processes read while one of them writes.
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )"""
+        )
+        self._connection.commit()
+
+    def get_many(self, model: str, hashes: List[str]) -> dict:
+        found = {}
+        unique_hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            # Stay well under SQLite's bound parameter limit.
+            for start in range(0, len(unique_hashes), 500):
+                batch = unique_hashes[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._connection.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch],
+                ).fetchall()
+                for row_hash, blob in rows:
+                    vector = array("f")
+                    vector.frombytes(blob)
+                    found[row_hash] = vector.tolist()
+        return found
+
+    def put_many(self, model: str, items: dict):
+        if not items:
+            return
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                [
+                    (model, item_hash, array("f", vector).tobytes())
+                    for item_hash, vector in items.items()
+                ],
+            )
+            self._connection.commit()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model wrapper that only sends uncached chunks upstream."""
+
+    _embed_model: BaseEmbedding = PrivateAttr()
+    _store: EmbeddingStore = PrivateAttr()
+    _tokenizer: Optional[Callable] = PrivateAttr()
+    _stats_lock: threading.Lock = PrivateAttr()
+    _stats: dict = PrivateAttr()
+    _max_batch_tokens: int = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        store: Optional[EmbeddingStore] = None,
+        tokenizer: Optional[Callable] = None,
+        max_batch_tokens: int = max_batch_tokens,
+        **kwargs: Any,
+    ):
+        # With a tokenizer, batches are packed by token count instead of the
+        # inner model's fixed size, so indexing takes as few calls as allowed.
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=max_batch_inputs
+            if tokenizer is not None
+            else embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._embed_model = embed_model
+        self._store = store or EmbeddingStore()
+        self._tokenizer = tokenizer
+        self._max_batch_tokens = max_batch_tokens
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "cached_tokens": 0}
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _lookup(self, texts: List[str]):
+        hashes = [text_hash(text) for text in texts]
+        found = self._store.get_many(self.model_name, hashes)
+        missing = {}
+        for text, item_hash in zip(texts, hashes):
+            if item_hash not in found and item_hash not in missing:
+                missing[item_hash] = text
+
+        cached_tokens = 0
+        if self._tokenizer is not None:
+            cached_tokens = sum(
+                len(self._tokenizer(text))
+                for text, item_hash in zip(texts, hashes)
+                if item_hash in found
+            )
+        batch = {
+            "hits": len(texts) - len(missing),
+            "misses": len(missing),
+            "cached_tokens": cached_tokens,
+        }
+        thread_stats = getattr(_batch_stats, "stats", None) or dict.fromkeys(batch, 0)
+        _batch_stats.stats = {
+            name: thread_stats[name] + value for name, value in batch.items()
+        }
+        with self._stats_lock:
+            for name, value in batch.items():
+                self._stats[name] += value
+        return hashes, found, missing
+
+    def _token_batches(self, texts: List[str]) -> List[List[str]]:
+        if self._tokenizer is None:
+            size = self._embed_model.embed_batch_size
+            return [texts[start : start + size] for start in range(0, len(texts), size)]
+        batches = []
+        batch_tokens = 0
+        for text in texts:
+            tokens = len(self._tokenizer(text))
+            if (
+                not batches
+                or batch_tokens + tokens > self._max_batch_tokens
+                or len(batches[-1]) == max_batch_inputs
+            ):
+                batches.append([])
+                batch_tokens = 0
+            batches[-1].append(text)
+            batch_tokens += tokens
+        return batches
+
+    def _store_results(self, hashes, found, missing, vectors):
+        computed = dict(zip(missing.keys(), vectors))
+        self._store.put_many(self.model_name, computed)
+        found.update(computed)
+        return [found[item_hash] for item_hash in hashes]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        hashes, found, missing = self._lookup(texts)
+        vectors = []
+        for batch in self._token_batches(list(missing.values())):
+            vectors += self._embed_model._get_text_embeddings(batch)
+        return self._store_results(hashes, found, missing, vectors)
+
+    async def _aget_text_embeddings(self, texts: List[str]) -> List[List[float]]:
+        hashes, found, missing = self._lookup(texts)
+        vectors = []
+        for batch in self._token_batches(list(missing.values())):
+            vectors += await self._embed_model._aget_text_embeddings(batch)
+        return self._store_results(hashes, found, missing, vectors)
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text: str) -> List[float]:
+        return (await self._aget_text_embeddings([text]))[0]
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._embed_model._get_query_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return await self._embed_model._aget_query_embedding(query)
@@ -0,0 +1,84 @@
+from typing import List, Optional, Tuple
+
+from llama_index.core import Settings
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+from llama_index.core.vector_stores.types import (
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+)
+
+rrf_k = 60
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = rrf_k) -> List[Tuple[str, float]]:
+    """Fuses ranked id lists by summing ``1 / (k + rank)``. Ranks don't care
+    that cosine similarities and BM25 scores live on different scales."""
+    scores = {}
+    for ranking in rankings:
+        for rank, node_id in enumerate(ranking, start=1):
+            scores[node_id] = scores.get(node_id, 0.0) + 1 / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridRetriever(BaseRetriever):
+    """Retrieves ``candidates`` chunks by embedding and by BM25 on
+    ``lexical_query``, and keeps the ``similarity_top_k`` best after fusion.
+    Dense results under ``score_cutoff`` times the best cosine similarity are
+    dropped before fusing.
+
+    Needs an index backed by ``MmapVectorStore``, which answers the sparse
+    half from the BM25 index it persists with the vectors.
+    """
+
+    def __init__(
+        self,
+        index,
+        lexical_query: str,
+        similarity_top_k: int,
+        candidates: int,
+        filters: MetadataFilters = None,
+        score_cutoff: Optional[float] = None,
+    ):
+        self._index = index
+        self._lexical_query = lexical_query
+        self._similarity_top_k = similarity_top_k
+        self._candidates = max(candidates, similarity_top_k)
+        self._filters = filters
+        self._score_cutoff = score_cutoff
+        self._dense = index.as_retriever(
+            similarity_top_k=self._candidates, filters=filters
+        )
+        super().__init__(callback_manager=Settings.callback_manager)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        # retrieve() has already opened this retrieval's event, so the dense
+        # half is called directly to keep it from being counted twice.
+        dense = self._dense._retrieve(query_bundle)
+        if dense and self._score_cutoff is not None and (dense[0].score or 0) > 0:
+            best = dense[0].score
+            dense = [
+                result
+                for result in dense
+                if (result.score or 0) >= best * self._score_cutoff
+            ]
+        sparse = self._index.vector_store.query(
+            VectorStoreQuery(
+                query_str=self._lexical_query,
+                mode=VectorStoreQueryMode.SPARSE,
+                similarity_top_k=self._candidates,
+                filters=self._filters,
+            )
+        )
+        fused = reciprocal_rank_fusion(
+            [[result.node.node_id for result in dense], sparse.ids or []]
+        )[: self._similarity_top_k]
+
+        nodes = {result.node.node_id: result.node for result in dense}
+        missing = [node_id for node_id, _ in fused if node_id not in nodes]
+        if missing:
+            nodes.update(
+                (node.node_id, node) for node in self._index.docstore.get_nodes(missing)
+            )
+        return [NodeWithScore(node=nodes[node_id], score=score) for node_id, score in fused]
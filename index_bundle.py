@@ -0,0 +1,215 @@
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional
+
+import numpy as np
+from llama_index.core import StorageContext, load_index_from_storage
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.index_store import SimpleIndexStore
+
+from index_cache import entry_path
+from vector_store import (
+    MmapVectorStore,
+    bm25_path,
+    matrix_path,
+    scales_path,
+    vector_store_file,
+)
+
+bundle_directory = os.getenv("INDEX_BUNDLE_DIR", "./index_bundles/")
+bundle_suffix = ".bcoidx"
+bundle_magic = b"BCOIDX01"
+bundle_format = 1
+# Sections start on 64 byte boundaries, so the matrix can be mapped in place.
+alignment = 64
+matrix_file = os.path.basename(matrix_path(vector_store_file))
+scales_file = os.path.basename(scales_path(vector_store_file))
+bm25_file = os.path.basename(bm25_path(vector_store_file))
+bundle_files = [
+    "docstore.json",
+    "index_store.json",
+    vector_store_file,
+    matrix_file,
+    scales_file,
+    bm25_file,
+]
+npy_header_readers = {
+    (1, 0): np.lib.format.read_array_header_1_0,
+    (2, 0): np.lib.format.read_array_header_2_0,
+}
+
+
+def aligned(offset: int) -> int:
+    return -(-offset // alignment) * alignment
+
+
+def bundle_path(key: str, directory: str = bundle_directory) -> str:
+    return os.path.join(directory, key + bundle_suffix)
+
+
+def write_bundle(key: str, manifest: dict, directory: str = bundle_directory) -> str:
+    """Packs the index cache entry for ``key`` into one file.
+
+    The file is a magic number, the manifest's length and the JSON manifest,
+    then each stored file at the offset the manifest lists for it.
+    """
+    source = entry_path(key)
+    names = [name for name in bundle_files if os.path.exists(os.path.join(source, name))]
+    files = {}
+    offset = 0
+    for name in names:
+        length = os.path.getsize(os.path.join(source, name))
+        files[name] = {"offset": offset, "length": length}
+        offset = aligned(offset + length)
+    header = json.dumps(
+        {
+            **manifest,
+            "format": bundle_format,
+            "key": key,
+            "created": time.time(),
+            "files": files,
+        }
+    ).encode("utf-8")
+    data_start = aligned(len(bundle_magic) + 8 + len(header))
+
+    os.makedirs(directory, exist_ok=True)
+    path = bundle_path(key, directory)
+    staging_path = f"{path}.{os.getpid()}.{time.time_ns()}.tmp"
+    with open(staging_path, "wb") as f:
+        f.write(bundle_magic + struct.pack("<Q", len(header)) + header)
+        for name in names:
+            f.seek(data_start + files[name]["offset"])
+            with open(os.path.join(source, name), "rb") as part:
+                while True:
+                    block = part.read(1024 * 1024)
+                    if not block:
+                        break
+                    f.write(block)
+    os.replace(staging_path, path)
+    return path
+
+
+def read_manifest(path: str) -> dict:
+    """The bundle's manifest, with each file's offset made absolute."""
+    with open(path, "rb") as f:
+        if f.read(len(bundle_magic)) != bundle_magic:
+            raise ValueError(f"{path} is not an index bundle")
+        (length,) = struct.unpack("<Q", f.read(8))
+        manifest = json.loads(f.read(length))
+    if manifest.get("format") != bundle_format:
+        raise ValueError(f"{path} has unsupported bundle format {manifest.get('format')}")
+    data_start = aligned(len(bundle_magic) + 8 + length)
+    for part in manifest["files"].values():
+        part["offset"] += data_start
+    return manifest
+
+
+def map_array(path: str, offset: int) -> np.ndarray:
+    # The .npy header is parsed where it sits in the bundle, and the array
+    # behind it is mapped read-only rather than read.
+    with open(path, "rb") as f:
+        f.seek(offset)
+        version = np.lib.format.read_magic(f)
+        shape, fortran_order, dtype = npy_header_readers[version](f)
+        data_offset = f.tell()
+    return np.memmap(
+        path,
+        dtype=dtype,
+        mode="r",
+        offset=data_offset,
+        shape=shape,
+        order="F" if fortran_order else "C",
+    )
+
+
+def load_bundle(key: str, directory: str = bundle_directory):
+    """Loads the bundled index for ``key``, or returns None if there isn't one.
+
+    Chunks and metadata are parsed from the bundle's JSON, the embeddings
+    are memory mapped from it, so nothing is embedded.
+    """
+    path = bundle_path(key, directory)
+    if not os.path.exists(path):
+        return None
+    manifest = read_manifest(path)
+    if manifest["key"] != key:
+        raise ValueError(f"{path} holds the index for {manifest['key']}, not {key}")
+    files = manifest["files"]
+
+    with open(path, "rb") as f:
+
+        def read_json(name: str):
+            if name not in files:
+                return None
+            f.seek(files[name]["offset"])
+            return json.loads(f.read(files[name]["length"]))
+
+        docstore = SimpleDocumentStore.from_dict(read_json("docstore.json"))
+        index_store = SimpleIndexStore.from_dict(read_json("index_store.json"))
+        vector_store_data = read_json(vector_store_file)
+        bm25_rows = read_json(bm25_file)
+
+    matrix, scales = (
+        map_array(path, files[name]["offset"]) if name in files else None
+        for name in (matrix_file, scales_file)
+    )
+    vector_store = MmapVectorStore.from_persisted(
+        vector_store_data, matrix, scales, bm25_rows
+    )
+    storage_context = StorageContext.from_defaults(
+        docstore=docstore, index_store=index_store, vector_store=vector_store
+    )
+    return load_index_from_storage(storage_context)
+
+
+def bundle_manifest(key: str, directory: str = bundle_directory) -> Optional[dict]:
+    path = bundle_path(key, directory)
+    if not os.path.exists(path):
+        return None
+    return read_manifest(path)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Pre-index PDFs into portable index bundles, or inspect one."
+    )
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Index PDFs and write their bundles.")
+    export.add_argument("source", help="A directory of PDFs or a manifest file.")
+    export.add_argument("--output", default=bundle_directory)
+    export.add_argument("--workers", type=int, default=4)
+    inspect = commands.add_parser("inspect", help="Print a bundle's manifest.")
+    inspect.add_argument("bundle")
+    args = parser.parse_args(argv)
+
+    if args.command == "inspect":
+        print(json.dumps(read_manifest(args.bundle), indent=2))
+        return 0
+
+    # Loading the pipeline sets up the models, so it only happens for exports.
+    from batch import collect_inputs
+    from pipeline import export_bundle
+
+    pdf_paths = collect_inputs(args.source)
+    failed = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(export_bundle, pdf_path, args.output): pdf_path
+            for pdf_path in pdf_paths
+        }
+        for future in as_completed(futures):
+            try:
+                print(f"[exported] {futures[future]} -> {future.result()}")
+            except Exception as e:
+                failed += 1
+                print(f"[failed] {futures[future]}: {e}", file=sys.stderr)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+from llama_index.core import StorageContext, load_index_from_storage
+from vector_store import forget_shared_vector_store, shared_vector_store
+
+cache_directory = os.getenv("INDEX_CACHE_DIR", "./index_cache/")
+max_cache_bytes = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+entry_metadata_file = "cache_entry.json"
+
+
+def file_hash(path, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(
+    content_hashes: list,
+    embed_model_name: str,
+    chunk_size: int,
+    chunk_overlap: int,
+    storage_format: str = "simple",
+    chunker: str = "sentence",
+) -> str:
+    # Anything that changes the stored vectors has to be part of the key.
+    payload = json.dumps(
+        {
+            "content": sorted(content_hashes),
+            "embed_model": embed_model_name,
+            "chunk_size": chunk_size,
+            "chunk_overlap": chunk_overlap,
+            "storage_format": storage_format,
+            "chunker": chunker,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def entry_path(key: str) -> str:
+    return os.path.join(cache_directory, key)
+
+
+def load_cached_index(key: str):
+    path = entry_path(key)
+    metadata_path = os.path.join(path, entry_metadata_file)
+    if not os.path.exists(metadata_path):
+        return None
+    try:
+        vector_store = shared_vector_store(path)
+    except KeyError:
+        # Persisted by llama-index's SimpleVectorStore, not ours, so the
+        # entry is dropped and rebuilt.
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+    storage_context = StorageContext.from_defaults(
+        persist_dir=path, vector_store=vector_store
+    )
+    index = load_index_from_storage(storage_context)
+    # The metadata file's mtime doubles as the LRU timestamp.
+    os.utime(metadata_path)
+    return index
+
+
+def store_index(key: str, index, metadata: dict = None):
+    os.makedirs(cache_directory, exist_ok=True)
+    path = entry_path(key)
+    staging_path = f"{path}.{os.getpid()}.{time.time_ns()}.tmp"
+    index.storage_context.persist(persist_dir=staging_path)
+    with open(os.path.join(staging_path, entry_metadata_file), "w") as f:
+        json.dump({"key": key, "created": time.time(), **(metadata or {})}, f)
+
+    # Persist to a staging directory and rename so a concurrent reader never
+    # sees a half written entry. If another session won the race keep theirs.
+    try:
+        os.rename(staging_path, path)
+    except OSError:
+        shutil.rmtree(staging_path, ignore_errors=True)
+
+    evict_entries()
+
+
+def read_entry_metadata(key: str) -> dict:
+    with open(os.path.join(entry_path(key), entry_metadata_file)) as f:
+        return json.load(f)
+
+
+def register_source(key: str, file_name: str):
+    metadata_path = os.path.join(entry_path(key), entry_metadata_file)
+    try:
+        metadata = read_entry_metadata(key)
+    except (OSError, ValueError):
+        return
+    if file_name in metadata.get("files", []):
+        return
+    metadata["files"] = metadata.get("files", []) + [file_name]
+    # Replaced rather than rewritten in place, so a crash can't leave the
+    # entry with truncated metadata.
+    descriptor, temp_path = tempfile.mkstemp(dir=entry_path(key), suffix=".tmp")
+    try:
+        with os.fdopen(descriptor, "w") as f:
+            json.dump(metadata, f)
+        os.replace(temp_path, metadata_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def prune_missing_sources(source_directory: str):
+    # An entry is stale once none of the uploads it was built from remain.
+    for entry in list_entries():
+        try:
+            files = read_entry_metadata(entry["key"]).get("files", [])
+        except (OSError, ValueError):
+            continue
+        if files and not any(
+            os.path.exists(os.path.join(source_directory, name)) for name in files
+        ):
+            forget_shared_vector_store(entry["path"])
+            shutil.rmtree(entry["path"], ignore_errors=True)
+
+
+def directory_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                total += os.path.getsize(os.path.join(root, name))
+            except OSError:
+                pass
+    return total
+
+
+def list_entries() -> list:
+    if not os.path.isdir(cache_directory):
+        return []
+    entries = []
+    for name in os.listdir(cache_directory):
+        metadata_path = os.path.join(cache_directory, name, entry_metadata_file)
+        if not os.path.exists(metadata_path):
+            continue
+        path = os.path.join(cache_directory, name)
+        entries.append(
+            {
+                "key": name,
+                "path": path,
+                "last_used": os.path.getmtime(metadata_path),
+                "size": directory_size(path),
+            }
+        )
+    return entries
+
+
+def evict_entries(max_bytes: int = max_cache_bytes):
+    entries = sorted(list_entries(), key=lambda entry: entry["last_used"])
+    total = sum(entry["size"] for entry in entries)
+    # Always keep the most recently used entry, even if it alone is over budget.
+    while total > max_bytes and len(entries) > 1:
+        oldest = entries.pop(0)
+        forget_shared_vector_store(oldest["path"])
+        shutil.rmtree(oldest["path"], ignore_errors=True)
+        total -= oldest["size"]
@@ -0,0 +1,103 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Callable, Optional
+
+from index_cache import entry_path
+from vector_store import forget_shared_vector_store
+
+max_index_memory_bytes = int(
+    os.getenv("INDEX_MEMORY_MAX_BYTES", str(2 * 1024 * 1024 * 1024))
+)
+
+
+def index_nbytes(index) -> int:
+    # A rough estimate, the vectors plus the node text held by the docstore.
+    vector_store = index.storage_context.vector_store
+    total = getattr(vector_store, "nbytes", 0)
+    for node in index.docstore.docs.values():
+        total += len(node.get_content()) + len(str(node.metadata))
+    return total
+
+
+class IndexRegistry:
+    """Process wide LRU of loaded indexes, bounded by estimated memory.
+
+    Sessions hold index keys rather than the indexes themselves. An index
+    evicted here is only dropped from memory, it stays in the disk cache and
+    ``get`` reloads it on next use.
+    """
+
+    def __init__(self, max_bytes: int = max_index_memory_bytes):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._sessions = {}
+        self._loading = {}
+
+    def get(self, key: str, load: Callable, session: Optional[str] = None):
+        with self._lock:
+            index = self._use(key, session)
+            if index is not None:
+                return index
+            key_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Sessions asking for the same paper wait for a single load.
+        try:
+            with key_lock:
+                with self._lock:
+                    index = self._use(key, session)
+                if index is None:
+                    index = load()
+                    self.put(key, index, session)
+        finally:
+            with self._lock:
+                self._loading.pop(key, None)
+        return index
+
+    def _use(self, key: str, session: Optional[str]):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        self._entries.move_to_end(key)
+        if session is not None:
+            self._sessions[session] = key
+        return entry["index"]
+
+    def put(self, key: str, index, session: Optional[str] = None):
+        nbytes = index_nbytes(index)
+        with self._lock:
+            self._entries[key] = {"index": index, "nbytes": nbytes}
+            self._entries.move_to_end(key)
+            if session is not None:
+                self._sessions[session] = key
+            self._evict()
+
+    def _evict(self):
+        total = sum(entry["nbytes"] for entry in self._entries.values())
+        # Always keep the most recently used index, even if it alone is over
+        # budget. Queries already holding an evicted index can still finish.
+        while total > self.max_bytes and len(self._entries) > 1:
+            key, entry = self._entries.popitem(last=False)
+            total -= entry["nbytes"]
+            forget_shared_vector_store(entry_path(key))
+            self._sessions = {
+                session: session_key
+                for session, session_key in self._sessions.items()
+                if session_key != key
+            }
+
+    def session_usage(self, session: str) -> dict:
+        with self._lock:
+            key = self._sessions.get(session)
+            entry = self._entries.get(key) if key is not None else None
+            sharing = list(self._sessions.values()).count(key) if entry else 0
+            return {
+                "nbytes": entry["nbytes"] if entry else 0,
+                "shared_with": max(sharing - 1, 0),
+                "total_nbytes": sum(
+                    other["nbytes"] for other in self._entries.values()
+                ),
+                "indexes": len(self._entries),
+                "sessions": len(self._sessions),
+            }
@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+
+from trace_context import trace_tags
+
+job_workers = int(os.getenv("JOB_WORKERS", "8"))
+job_retention = float(os.getenv("JOB_RETENTION", str(24 * 60 * 60)))
+finished_statuses = ("done", "failed", "cancelled")
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class Job:
+
+    def __init__(
+        self, kind: str, session: Optional[str], params: dict, after: List["Job"] = ()
+    ):
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.session = session
+        self.params = params
+        self.after = list(after)
+        self.status = "queued"
+        self.progress = {}
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.future = None
+        self._cancel = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def done(self) -> bool:
+        return self.status in finished_statuses
+
+    @property
+    def waiting_for(self) -> List["Job"]:
+        return [job for job in self.after if not job.done]
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel.is_set()
+
+    def update(self, **progress):
+        # Every progress report doubles as a cancellation point.
+        if self._cancel.is_set():
+            raise JobCancelled()
+        with self._lock:
+            self.progress.update(progress)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.progress)
+
+
+class JobQueue:
+    """Runs indexing and generation work off the Streamlit script thread.
+
+    Jobs are kept per process, so their progress and results outlive the
+    rerun, or the page reload, that submitted them. A job submitted ``after``
+    others is only handed to a worker once they have all finished, however
+    they finished, so it holds no worker while it waits.
+    """
+
+    def __init__(self, workers: int = job_workers, retention: float = job_retention):
+        self.retention = retention
+        self._executor = ThreadPoolExecutor(
+            max_workers=workers, thread_name_prefix="bco-job"
+        )
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._waiting = {}
+
+    def submit(
+        self, kind: str, run: Callable, session: str = None, after: List[Job] = (), **params
+    ) -> Job:
+        job = Job(kind, session, params, after)
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+            if job.waiting_for:
+                # Started by _release() when the last of them finishes.
+                self._waiting[job.id] = run
+                return job
+        job.future = self._executor.submit(self._run, job, run)
+        return job
+
+    def _release(self):
+        with self._lock:
+            ready = [
+                (self._jobs[job_id], run)
+                for job_id, run in self._waiting.items()
+                if not self._jobs[job_id].waiting_for
+            ]
+            for job, _ in ready:
+                del self._waiting[job.id]
+        for job, run in ready:
+            job.future = self._executor.submit(self._run, job, run)
+
+    def _run(self, job: Job, run: Callable):
+        if job.cancel_requested:
+            job.status = "cancelled"
+            job.finished = time.time()
+            return
+        job.status = "running"
+        try:
+            with trace_tags(session=job.session):
+                job.result = run(job)
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            job.finished = time.time()
+            self._release()
+
+    def cancel(self, job_id: str):
+        job = self.get(job_id)
+        if job is None or job.done:
+            return
+        job._cancel.set()
+        with self._lock:
+            waiting = self._waiting.pop(job_id, None) is not None
+        # Queued jobs never start, running ones stop at their next update().
+        if waiting or (job.future is not None and job.future.cancel()):
+            job.status = "cancelled"
+            job.finished = time.time()
+            self._release()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def for_session(self, session: str) -> List[Job]:
+        with self._lock:
+            return [job for job in self._jobs.values() if job.session == session]
+
+    def _prune(self):
+        cutoff = time.time() - self.retention
+        for job_id, job in list(self._jobs.items()):
+            if job.done and job.finished < cutoff:
+                del self._jobs[job_id]
@@ -0,0 +1,115 @@
+import os
+import sqlite3
+import threading
+import time
+from typing import List
+
+from trace_context import current_tags
+
+ledger_path = os.getenv("LEDGER_PATH", "./usage_ledger.sqlite3")
+usage_columns = [
+    "prompt_tokens",
+    "completion_tokens",
+    "embedding_tokens",
+    "cached_embedding_tokens",
+    "cached_chunks",
+    "embedded_chunks",
+    "cost",
+]
+group_columns = ("session", "document", "domain", "kind", "model")
+
+
+class UsageLedger:
+
+    def __init__(self, path: str = ledger_path, pricing: dict = None):
+        self.pricing = pricing or {"llm": {}, "embedding": {}}
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS usage (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created REAL NOT NULL,
+                session TEXT,
+                document TEXT,
+                domain TEXT,
+                kind TEXT NOT NULL,
+                model TEXT,
+                prompt_tokens INTEGER NOT NULL DEFAULT 0,
+                completion_tokens INTEGER NOT NULL DEFAULT 0,
+                embedding_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_embedding_tokens INTEGER NOT NULL DEFAULT 0,
+                cached_chunks INTEGER NOT NULL DEFAULT 0,
+                embedded_chunks INTEGER NOT NULL DEFAULT 0,
+                cost REAL NOT NULL DEFAULT 0
+            )"""
+        )
+        for column in ("session", "document"):
+            self._connection.execute(
+                f"CREATE INDEX IF NOT EXISTS usage_{column} ON usage ({column})"
+            )
+        self._connection.commit()
+
+    def cost(self, kind: str, model: str, usage: dict) -> float:
+        if kind in ("llm", "llm_repair") and model in self.pricing["llm"]:
+            prices = self.pricing["llm"][model]
+            return (usage.get("prompt_tokens", 0) / 1000) * prices[
+                "input_token_cost_multiplier"
+            ] + (usage.get("completion_tokens", 0) / 1000) * prices[
+                "output_token_cost_multiplier"
+            ]
+        if kind == "embedding" and model in self.pricing["embedding"]:
+            billed = usage.get("embedding_tokens", 0) - usage.get(
+                "cached_embedding_tokens", 0
+            )
+            return (max(billed, 0) / 1000) * self.pricing["embedding"][model]
+        return 0.0
+
+    def record(self, kind: str, model: str = None, **usage):
+        tags = {**current_tags(), **{k: usage.pop(k) for k in list(usage) if k in group_columns}}
+        usage["cost"] = self.cost(kind, model, usage)
+        values = [usage.get(column, 0) for column in usage_columns]
+        with self._lock:
+            self._connection.execute(
+                f"""INSERT INTO usage (created, session, document, domain, kind, model, {", ".join(usage_columns)})
+                VALUES (?, ?, ?, ?, ?, ?, {", ".join("?" * len(usage_columns))})""",
+                [
+                    time.time(),
+                    tags.get("session"),
+                    tags.get("document"),
+                    tags.get("domain"),
+                    kind,
+                    model,
+                    *values,
+                ],
+            )
+            self._connection.commit()
+
+    def aggregate(self, group_by: tuple = (), since: float = None, **filters) -> List[dict]:
+        """Sum usage, optionally grouped by any of session, document, domain,
+        kind or model, e.g. ``aggregate(("document",))`` for cost per paper."""
+        for column in (*group_by, *filters):
+            if column not in group_columns:
+                raise ValueError(f"Unknown ledger column: {column}")
+        where = [f"{column} = ?" for column in filters]
+        parameters = list(filters.values())
+        if since is not None:
+            where.append("created >= ?")
+            parameters.append(since)
+        sums = ", ".join(f"SUM({column}) AS {column}" for column in usage_columns)
+        query = f"SELECT {', '.join((*group_by, sums, 'COUNT(*) AS requests'))} FROM usage"
+        if where:
+            query += " WHERE " + " AND ".join(where)
+        if group_by:
+            query += f" GROUP BY {', '.join(group_by)}"
+        with self._lock:
+            cursor = self._connection.execute(query, parameters)
+            names = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+        return [
+            {name: (0 if value is None else value) for name, value in zip(names, row)}
+            for row in rows
+        ]
+
+    def totals(self, **filters) -> dict:
+        return self.aggregate(**filters)[0]
@@ -1,35 +1,14 @@
-from llama_index.llms.openai import OpenAI
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, Settings
-from llama_index.embeddings.openai import OpenAIEmbedding
-from llama_index.core.callbacks import CallbackManager, TokenCountingHandler
-from dotenv import load_dotenv
-from prompts import (
-    USABILITY_DOMAIN,
-    IO_DOMAIN,
-    DESCRIPTION_DOMAIN,
-    EXECUTION_DOMAIN,
-    PARAMETRIC_DOMAIN,
-    ERROR_DOMAIN
-)
-import tiktoken
 import streamlit as st
+import json
 import os
+import re
+import shutil
+import time
+import uuid
 
-load_dotenv()
 save_directory = "./data/"
-
-token_counts = {"embedding": 0, "input": 0, "output": 0, "total": 0}
-model_choices = ["gpt-3.5-turbo", "gpt-4-turbo-preview", "gpt-4"]
-llm_model_name = model_choices[1]
-
-token_counter = TokenCountingHandler(
-    tokenizer=tiktoken.encoding_for_model(llm_model_name).encode
-)
-embed_model_name = "text-embedding-3-small"
-embed_model = OpenAIEmbedding(model=embed_model_name)
-Settings.llm = OpenAI(model=llm_model_name)
-Settings.callback_manager = CallbackManager([token_counter])
-Settings.embed_model = embed_model
+workspace_ttl = float(os.getenv("WORKSPACE_TTL", str(24 * 60 * 60)))
+job_poll_interval = float(os.getenv("JOB_POLL_INTERVAL", "1"))
 
 st.set_page_config(
     page_title="Biocompute Object Assistant Proof of Concept",
@@ -37,85 +16,199 @@ st.set_page_config(
     menu_items={"About": "Built by @seankim658 with Streamlit and LlamaIndex."},
 )
 
-if "embed_tokens" not in st.session_state:
-    st.session_state["embed_tokens"] = 0
+if "pdf_upload" not in st.session_state:
+    st.session_state["pdf_upload"] = None
 
-if "llm_input_tokens" not in st.session_state:
-    st.session_state["llm_input_tokens"] = 0
+if "index_key" not in st.session_state:
+    st.session_state["index_key"] = None
 
-if "llm_output_tokens" not in st.session_state:
-    st.session_state["llm_output_tokens"] = 0
+@st.cache_resource(show_spinner="Loading models...")
+def load_pipeline():
+    # Imported on first use rather than at the top of the script, so the
+    # upload page draws before llama-index, tiktoken and the OpenAI clients
+    # load. The module is then shared by every rerun and session.
+    started = time.perf_counter()
+    import pipeline
 
-if "pdf_upload" not in st.session_state:
-    st.session_state["pdf_upload"] = None
+    pipeline.tracer.record(
+        "cold_start", time.perf_counter() - started, session=session_id()
+    )
+    return pipeline
+
+
+@st.cache_resource
+def load_usage_ledger():
+    # A connection of the app's own to the pipeline's ledger, so the sidebar
+    # can show usage before the models are loaded.
+    from ledger import UsageLedger
+
+    return UsageLedger()
 
-if "index" not in st.session_state:
-    st.session_state["index"] = None
-
-model_cost_information = {
-    "llm": {
-        "gpt-3.5-turbo": {
-            "input_token_cost_multiplier": 0.00005,
-            "output_token_cost_multiplier": 0.00015,
-        },
-        "gpt-4-turbo-preview": {
-            "input_token_cost_multiplier": 0.01,
-            "output_token_cost_multiplier": 0.03,
-        },
-        "gpt-4": {
-            "input_token_cost_multiplier": 0.03,
-            "output_token_cost_multiplier": 0.06,
-        },
-    },
-    "embedding": {
-        "text-embedding-3-small": 0.00002,
-        "text-embedding-3-large": 0.00013,
-        "ada-v2": 0.00010,
-    },
-}
 
 def sidebar():
+    from model_settings import (
+        embed_model_name,
+        llm_model_name,
+        model_cost_information,
+    )
+    from tracing import tracer
+
+    usage_ledger = load_usage_ledger()
+
+    # Usage comes from the ledger, so it only counts this session's requests.
+    usage = {
+        (row["kind"], row["model"]): row
+        for row in usage_ledger.aggregate(("kind", "model"), session=session_id())
+    }
+    cached_responses = sum(
+        row["requests"] for (kind, _), row in usage.items() if kind == "llm_cache_hit"
+    )
 
     for model in model_cost_information["llm"].keys():
         model_match = llm_model_name == model
         with st.sidebar.expander(f"💲 {model} INFERENCE COST", expanded=model_match):
-            input_tokens = st.session_state["llm_input_tokens"]
-            output_tokens = st.session_state["llm_output_tokens"]
-            st.markdown(f"LLM Prompt: {input_tokens} tokens")
-            st.markdown(f"LLM Output: {output_tokens} tokens")
-            i_cost = (input_tokens / 1000) * model_cost_information["llm"][model][
-                "input_token_cost_multiplier"
-            ]
-            o_cost = (output_tokens / 1000) * model_cost_information["llm"][model][
-                "output_token_cost_multiplier"
-            ]
-            st.markdown(
-                "Rough Cost Estimation: **${0}**".format(round(i_cost + o_cost, 5))
-            )
+            row = usage.get(("llm", model), {})
+            repair = usage.get(("llm_repair", model), {})
+            st.markdown(f"LLM Prompt: {row.get('prompt_tokens', 0)} tokens")
+            st.markdown(f"LLM Output: {row.get('completion_tokens', 0)} tokens")
+            if repair:
+                st.markdown(
+                    f"Schema Repairs: {repair['prompt_tokens']} prompt / "
+                    f"{repair['completion_tokens']} output tokens"
+                )
+            if model_match:
+                st.markdown(f"Cached Responses: {cached_responses} (no cost)")
+            cost = row.get("cost", 0.0) + repair.get("cost", 0.0)
+            st.markdown("Cost: **${0}**".format(round(cost, 5)))
             "[OpenAI Pricing](https://openai.com/pricing)"
 
     for embedder in model_cost_information["embedding"].keys():
         embed_match = embed_model_name == embedder
         with st.sidebar.expander(f"💲 {embedder} INFERENCE COST", expanded=embed_match):
-            embed_tokens = st.session_state["embed_tokens"]
-            st.markdown(f"Embed Tokens: {embed_tokens}")
-            cost = (embed_tokens / 1000) * model_cost_information["embedding"][embedder]
-            st.markdown("Rough Cost Estimation: **${0}**".format(round(cost, 5)))
+            row = usage.get(("embedding", embedder), {})
+            cached_tokens = row.get("cached_embedding_tokens", 0)
+            st.markdown(f"Embed Tokens: {row.get('embedding_tokens', 0)}")
+            st.markdown(f"Served From Cache: {cached_tokens} tokens")
+            st.markdown(
+                f"Chunk Cache: {row.get('cached_chunks', 0)} hits / {row.get('embedded_chunks', 0)} misses"
+            )
+            saved = (cached_tokens / 1000) * model_cost_information["embedding"][embedder]
+            st.markdown("Cost: **${0}**".format(round(row.get("cost", 0.0), 5)))
+            st.markdown("Saved By Cache: **${0}**".format(round(saved, 5)))
             "[OpenAI Pricing](https://openai.com/pricing)"
 
+    with st.sidebar.expander("📒 USAGE BY DOMAIN"):
+        rows = usage_ledger.aggregate(("domain",), session=session_id(), kind="llm")
+        if rows:
+            st.table(
+                [
+                    {
+                        "domain": row["domain"] or "(none)",
+                        "prompt": row["prompt_tokens"],
+                        "output": row["completion_tokens"],
+                        "cost ($)": round(row["cost"], 5),
+                    }
+                    for row in rows
+                ]
+            )
+        else:
+            st.markdown("No domains generated yet.")
+
+    with st.sidebar.expander("🧠 INDEX MEMORY"):
+        index_key = st.session_state.get("index_key")
+        if index_key is None:
+            # Indexes are only held once a paper is indexed, which is what
+            # loads the models, so there is nothing to show before that.
+            st.markdown("No paper indexed yet.")
+        else:
+            pipeline = load_pipeline()
+            memory = pipeline.index_registry.session_usage(session_id())
+            st.markdown(f"This Session: {memory['nbytes'] / 2**20:.1f} MB")
+            if memory["shared_with"]:
+                st.markdown(f"Shared With: {memory['shared_with']} other sessions")
+            st.markdown(
+                f"All Sessions: {memory['total_nbytes'] / 2**20:.1f} MB of "
+                f"{pipeline.index_registry.max_bytes / 2**20:.0f} MB "
+                f"({memory['indexes']} indexes)"
+            )
+            cleaning = pipeline.cleaning_report(index_key)
+            if cleaning:
+                st.markdown(
+                    f"Boilerplate Removed: {cleaning['lines_removed']} lines, "
+                    f"{cleaning['chunks_removed']} duplicate chunks "
+                    f"({cleaning['tokens_saved']} embedding tokens saved)"
+                )
+
+    with st.sidebar.expander("⏱️ STAGE LATENCY"):
+        rows = tracer.summary(session=session_id())
+        if rows:
+            st.table(
+                [
+                    {
+                        "stage": row["stage"],
+                        "count": row["count"],
+                        "total (s)": round(row["total"], 3),
+                        "p50 (s)": round(row["p50"], 3),
+                        "p95 (s)": round(row["p95"], 3),
+                    }
+                    for row in rows
+                ]
+            )
+        else:
+            st.markdown("No requests traced yet.")
+        st.download_button(
+            "Export JSON Lines",
+            tracer.to_jsonl(session=session_id()),
+            file_name="bco_trace.jsonl",
+        )
+        st.download_button(
+            "Export Prometheus",
+            tracer.to_prometheus(),
+            file_name="bco_metrics.prom",
+        )
+
+    st.sidebar.toggle("Stream Responses", value=True, key="stream_responses")
     st.sidebar.button(
         "Clear Messages", type="primary", on_click=lambda: clear_messages()
     )
     st.sidebar.divider()
 
 
+def session_id() -> str:
+    # Kept in the URL rather than taken from the Streamlit session, so a page
+    # reload returns to the same workspace and its running jobs.
+    workspace = st.query_params.get("workspace", "")
+    if not re.fullmatch(r"[0-9a-f]{32}", workspace):
+        workspace = uuid.uuid4().hex
+        st.query_params["workspace"] = workspace
+    return workspace
+
+
 def clear_messages():
     st.session_state["messages"] = []
 
 
+def workspace_directory() -> str:
+    # Each session's uploads live apart, so users never see each other's
+    # papers. The mtime marks when the session last used it.
+    path = os.path.join(save_directory, session_id())
+    os.makedirs(path, exist_ok=True)
+    os.utime(path)
+    return path
+
+
+def prune_workspaces(max_age: float = workspace_ttl):
+    now = time.time()
+    for name in os.listdir(save_directory):
+        path = os.path.join(save_directory, name)
+        if os.path.isdir(path) and now - os.path.getmtime(path) > max_age:
+            shutil.rmtree(path, ignore_errors=True)
+
+
 def layout():
 
     st.header("Build your BioCompute Domains!")
+    sync_jobs()
 
     if st.session_state.get("pdf_upload") is None:
 
@@ -126,7 +219,7 @@ def layout():
 
         uploaded_pdf = st.file_uploader("Choose a PDF file", type=["pdf"])
         if uploaded_pdf is not None:
-            file_path = os.path.join(save_directory, uploaded_pdf.name)
+            file_path = os.path.join(workspace_directory(), uploaded_pdf.name)
             with open(file_path, "wb") as f:
                 f.write(uploaded_pdf.getbuffer())
             st.session_state["pdf_upload"] = uploaded_pdf.name
@@ -136,9 +229,10 @@ def layout():
 
         st.success("PDF uploaded, please wait while it is indexed...")
 
-        if st.session_state["index"] is not None:
+        if st.session_state["index_key"] is not None:
 
             st.success("Your PDF has successfully been indexed.")
+            pipeline = load_pipeline()
 
             usability_domain = st.session_state.get("get_usability_domain", False)
             io_domain = st.session_state.get("get_io_domain", False)
@@ -149,120 +243,286 @@ def layout():
             col1, col2, col3, col4, col5, col6 = st.columns([1, 1, 1, 1, 1, 1])
 
             with col1:
-                if st.button(
+                st.button(
                     "Generate Usability Domain",
                     type="primary",
-                    on_click=lambda: perform_query("usability"),
+                    on_click=lambda: queue_domain("usability"),
                     disabled=usability_domain,
-                ):
-                    st.session_state["get_usability_domain"] = True
+                )
             with col2:
-                if st.button(
+                st.button(
                     "Generate I/O Domain",
                     type="primary",
-                    on_click=lambda: perform_query("io"),
+                    on_click=lambda: queue_domain("io"),
                     disabled=io_domain,
-                ):
-                    st.session_state["get_io_domain"] = True
+                )
             with col3:
-                if st.button(
+                st.button(
                     "Generate Description Domain",
                     type="primary",
-                    on_click=lambda: perform_query("description"),
+                    on_click=lambda: queue_domain("description"),
                     disabled=description_domain,
-                ):
-                    st.session_state["get_description_domain"] = True
+                )
             with col4:
-                if st.button(
+                st.button(
                     "Generate Execution Domain",
                     type="primary",
-                    on_click=lambda: perform_query("execution"),
+                    on_click=lambda: queue_domain("execution"),
                     disabled=execution_domain,
-                ):
-                    st.session_state["get_execution_domain"] = True
+                )
             with col5:
-                if st.button(
+                st.button(
                     "Generate Parametric Domain",
                     type="primary",
-                    on_click=lambda: perform_query("parametric"),
+                    on_click=lambda: queue_domain("parametric"),
                     disabled=parametric_domain,
-                ):
-                    st.session_state["get_parametric_domain"] = True
+                )
             with col6:
-                if st.button(
+                st.button(
                     "Generate Error Domain",
                     type="primary",
-                    on_click=lambda: perform_query("error"),
+                    on_click=lambda: queue_domain("error"),
                     disabled=error_domain,
-                ):
-                    st.session_state["get_error_domain"] = True
+                )
+
+            st.button(
+                "Generate All Domains",
+                on_click=lambda: generate_all_domains(),
+                disabled=all(
+                    st.session_state.get(f"get_{domain}_domain", False)
+                    for domain in pipeline.domain_prompts
+                ),
+            )
 
-            if "messages" in st.session_state:
-                for message in st.session_state["messages"]:
-                    st.markdown(message)
+            regenerate_col, regenerate_button_col = st.columns([3, 1])
+            with regenerate_col:
+                regenerate_domain = st.selectbox(
+                    "Regenerate a domain, bypassing the response cache",
+                    list(pipeline.domain_prompts),
+                )
+            with regenerate_button_col:
+                st.button(
+                    "Regenerate",
+                    on_click=lambda: queue_domain(regenerate_domain, refresh=True),
+                )
+
+    # Outside the indexed branch, so an indexing failure is shown too.
+    if "messages" in st.session_state:
+        for message in st.session_state["messages"]:
+            st.markdown(message)
+
+    return show_jobs()
+
+
+@st.cache_resource
+def load_job_queue():
+    from jobs import JobQueue
+
+    return JobQueue()
+
+
+def sync_jobs():
+    """Apply each finished job of this workspace to the session state once.
+
+    After a page reload the session state starts empty, so this also
+    restores the upload, the index and the generated domains from the jobs.
+    """
+    applied = st.session_state.setdefault("applied_jobs", set())
+    for job in load_job_queue().for_session(session_id()):
+        if job.kind == "index" and job.status in ("queued", "running", "done"):
+            st.session_state["pdf_upload"] = job.params["file_name"]
+        if not job.done or job.id in applied:
+            continue
+        applied.add(job.id)
+
+        if job.kind == "index":
+            if job.status == "done":
+                st.session_state["index_key"] = job.result
+            else:
+                # Bring the uploader back so the PDF can be indexed again.
+                st.session_state["pdf_upload"] = None
+                st.session_state["index_key"] = None
+                if job.status == "failed":
+                    add_message(f"Indexing {job.params['file_name']} failed: {job.error}")
+            continue
+
+        domain = job.params["domain"]
+        if job.status == "done":
+            st.session_state[f"get_{domain}_domain"] = True
+            response = format_response(domain, job.result["response"])
+            if job.result["repaired"]:
+                response += "\n\nRegenerated to fix schema errors: " + ", ".join(
+                    f"`{path}`" for path in job.result["repaired"]
+                )
+            if job.result["errors"]:
+                response += f"\n\n⚠️ Still invalid against the schema: {job.result['errors']}"
+            print("Response:")
+            print(response)
+            add_message(response)
+        else:
+            # Failed and cancelled domains can be generated again.
+            st.session_state[f"get_{domain}_domain"] = False
+            if job.status == "failed":
+                add_message(f"The {domain} domain failed: {job.error}")
+
+
+def show_jobs() -> bool:
+    active = [
+        job for job in load_job_queue().for_session(session_id()) if not job.done
+    ]
+    for job in active:
+        progress = job.snapshot()
+        status_col, cancel_col = st.columns([5, 1])
+        with status_col:
+            if job.kind == "index":
+                total = progress.get("total_pages")
+                parsed = progress.get("pages_parsed", 0)
+                st.progress(
+                    parsed / total if total else 0.0,
+                    text=f"Indexing {job.params['file_name']}: {parsed}/{total or '?'} "
+                    f"pages parsed, {progress.get('chunks_embedded', 0)} chunks embedded",
+                )
+            elif job.waiting_for:
+                st.info(
+                    f"The {job.params['domain']} domain is waiting for the "
+                    f"{job.waiting_for[0].params['domain']} domain..."
+                )
+            elif job.status == "queued":
+                st.info(f"The {job.params['domain']} domain is waiting for a worker...")
+            else:
+                action = "Validating" if progress.get("repairing") else "Generating"
+                st.info(f"{action} the {job.params['domain']} domain...")
+                if progress.get("text"):
+                    st.markdown(progress["text"])
+        with cancel_col:
+            st.button(
+                "Cancel",
+                key=f"cancel-{job.id}",
+                on_click=load_job_queue().cancel,
+                args=(job.id,),
+            )
+    return bool(active)
 
 
 def index_pdf():
-    documents = SimpleDirectoryReader("data").load_data()
-    index = VectorStoreIndex.from_documents(documents)
-    token_counts["embedding"] += token_counter.total_embedding_token_count
-    st.session_state["embed_tokens"] += token_counts["embedding"]
-    st.session_state["index"] = index
+    pipeline = load_pipeline()
+    from index_cache import prune_missing_sources
 
+    file_name = st.session_state["pdf_upload"]
+    file_path = os.path.join(workspace_directory(), file_name)
+    prune_workspaces()
+    prune_missing_sources(save_directory)
 
-def perform_query(domain: str):
-    index = st.session_state["index"]
-    query_engine = index.as_query_engine()
-    response = f"This is a response for the {domain} domain.\n"
-
-    if domain == "usability":
-        query_response = query_engine.query(
-            f"Can you give me a Biocompute Object usability domain for the provided paper. The JSON return response must be valid against the JSON schema I am providing you. {USABILITY_DOMAIN}"
-        )
-    elif domain == "io":
-        query_response = query_engine.query(
-            f"Can you give me a Biocompute Object IO domain for the provided paper. The JSON return response must be valid against the JSON schema I am providing you. {IO_DOMAIN}"
-        )
-    elif domain == "description":
-        query_response = query_engine.query(
-            f"Can you give me a Biocompute Object description domain for the provided paper. The JSON return response must be valid against the JSON schema I am providing you. {DESCRIPTION_DOMAIN}"
-        )
-    elif domain == "execution":
-        query_response = query_engine.query(
-            f"Can you give me a Biocompute Object execution domain for the provided paper. The JSON return response must be valid against the JSON schema I am providing you. {EXECUTION_DOMAIN}"
+    def run(job) -> str:
+        key, _ = pipeline.get_index(
+            file_path, session=job.session, on_progress=job.update
         )
-    elif domain == "parametric":
-        query_response = query_engine.query(
-            f"Can you give me a Biocompute Object parametric domain for the provided paper. The JSON return response must be valid against the JSON schema I am providing you. {PARAMETRIC_DOMAIN}"
-        )
-    elif domain == "error":
-        query_response = query_engine.query(
-            f"Can you give me a Biocompute Object error domain for the provided paper. The JSON return response must be valid against the JSON schema I am providing you. {ERROR_DOMAIN}"
-        )
-    else:
-        return
+        return key
+
+    load_job_queue().submit("index", run, session=session_id(), file_name=file_name)
+
+
+def format_response(domain: str, query_response: str) -> str:
+    pipeline = load_pipeline()
+    from trace_context import trace_tags
 
-    str_query_response = str(query_response)
-    if not str_query_response.startswith("```json"):
-        str_query_response = "```json\n" + str_query_response + "\n```"
-    response += str(str_query_response)
-    print("Response:")
-    print(response)
+    # Runs on the script thread, which has no job's session tags.
+    with trace_tags(session=session_id()), pipeline.tracer.span(
+        "postprocess", domain=domain
+    ):
+        response = f"This is a response for the {domain} domain.\n"
+        str_query_response = str(query_response)
+        if not str_query_response.startswith("```json"):
+            str_query_response = "```json\n" + str_query_response + "\n```"
+        response += str(str_query_response)
+    return response
 
+
+def add_message(response: str):
     if "messages" not in st.session_state:
         st.session_state["messages"] = []
     st.session_state["messages"].append(response)
 
-    token_counts["input"] += token_counter.prompt_llm_token_count
-    st.session_state["llm_input_tokens"] += token_counts["input"]
-    token_counts["output"] += token_counter.completion_llm_token_count
-    st.session_state["llm_output_tokens"] += token_counts["output"]
-    token_counts["total"] += token_counter.total_llm_token_count
+
+def queue_domain(domain: str, refresh: bool = False):
+    pipeline = load_pipeline()
+    if domain not in pipeline.domain_prompts:
+        return
+
+    file_path = os.path.join(workspace_directory(), st.session_state["pdf_upload"])
+    index_key = st.session_state["index_key"]
+    stream = st.session_state["stream_responses"]
+    # Domains whose output this one is given as context go first if queued.
+    # The job starts once they finish, and takes whatever output they cached.
+    sources = pipeline.DOMAIN_CONTEXT_SOURCES.get(domain, ())
+    source_jobs = [
+        job
+        for job in load_job_queue().for_session(session_id())
+        if job.kind == "domain" and not job.done and job.params["domain"] in sources
+    ]
+
+    # Runs on a job worker, so it must not touch st.* or the session state.
+    def run(job) -> dict:
+        _, index = pipeline.get_index(file_path, key=index_key, session=job.session)
+        on_token = None
+        if stream:
+
+            def on_token(token: str):
+                job.update(text=job.snapshot().get("text", "") + token)
+
+        query_response, _, cache_key = pipeline.query_domain(
+            index, domain, index_key, refresh=refresh, on_token=on_token
+        )
+        job.update(repairing=True)
+        try:
+            data, errors, repaired = pipeline.repair_domain(
+                index, domain, query_response, index_key, cache_key
+            )
+        except Exception as e:
+            # The response is already paid for, so show it with its errors
+            # rather than failing the job.
+            data, errors = pipeline.validate_domain(domain, query_response)
+            errors = errors + [{"path": (), "message": f"could not be repaired ({e})"}]
+            repaired = []
+        pipeline.tracer.write_prometheus_textfile()
+        return {
+            "response": query_response
+            if data is None
+            else json.dumps(data, indent=4, ensure_ascii=False),
+            "errors": pipeline.describe_errors(errors),
+            "repaired": repaired,
+        }
+
+    st.session_state[f"get_{domain}_domain"] = True
+    load_job_queue().submit(
+        "domain", run, session=session_id(), after=source_jobs, domain=domain
+    )
+
+
+def generate_all_domains():
+    pipeline = load_pipeline()
+    for domain in pipeline.generation_order(list(pipeline.domain_prompts)):
+        if not st.session_state.get(f"get_{domain}_domain", False):
+            queue_domain(domain)
 
 
 def main():
+    from tracing import tracer
+
+    started = time.perf_counter()
+    polling = st.session_state.pop("polling", False)
+    # Neither the page nor the sidebar loads the models until a paper is
+    # indexed or queried.
+    jobs_running = layout()
     sidebar()
-    layout()
+    if not polling:
+        tracer.record("rerun", time.perf_counter() - started, session=session_id())
+
+    # Jobs run in the background, so poll until this workspace's are done.
+    if jobs_running:
+        time.sleep(job_poll_interval)
+        st.session_state["polling"] = True
+        st.rerun()
 
 
 if __name__ == "__main__":
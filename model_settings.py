@@ -0,0 +1,27 @@
+# Models and their prices, apart from pipeline.py so the app can show usage
+# and costs without loading the models.
+model_choices = ["gpt-3.5-turbo", "gpt-4-turbo-preview", "gpt-4"]
+llm_model_name = model_choices[1]
+embed_model_name = "text-embedding-3-small"
+
+model_cost_information = {
+    "llm": {
+        "gpt-3.5-turbo": {
+            "input_token_cost_multiplier": 0.00005,
+            "output_token_cost_multiplier": 0.00015,
+        },
+        "gpt-4-turbo-preview": {
+            "input_token_cost_multiplier": 0.01,
+            "output_token_cost_multiplier": 0.03,
+        },
+        "gpt-4": {
+            "input_token_cost_multiplier": 0.03,
+            "output_token_cost_multiplier": 0.06,
+        },
+    },
+    "embedding": {
+        "text-embedding-3-small": 0.00002,
+        "text-embedding-3-large": 0.00013,
+        "ada-v2": 0.00010,
+    },
+}
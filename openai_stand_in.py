@@ -0,0 +1,244 @@
+import argparse
+import base64
+import hashlib
+import json
+import random
+import threading
+import time
+from array import array
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import tiktoken
+
+encoder = tiktoken.get_encoding("cl100k_base")
+
+
+class RateWindow:
+    """Sliding one minute window of requests and tokens, like OpenAI's
+    per model limits. Tests can shorten the window to get short waits."""
+
+    def __init__(self, requests_per_minute: int, tokens_per_minute: int, seconds: float = 60):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.seconds = seconds
+        self._events = deque()
+        self._lock = threading.Lock()
+        self.stats = {"served": 0, "throttled": 0}
+
+    def admit(self, tokens: int) -> float:
+        """Returns 0 if the request is admitted, otherwise the seconds to wait."""
+        with self._lock:
+            now = time.monotonic()
+            while self._events and now - self._events[0][0] >= self.seconds:
+                self._events.popleft()
+            used = sum(event_tokens for _, event_tokens in self._events)
+            if (
+                len(self._events) >= self.requests_per_minute
+                or used + tokens > self.tokens_per_minute
+            ):
+                self.stats["throttled"] += 1
+                oldest = self._events[0][0] if self._events else now
+                return max(0.1, self.seconds - (now - oldest))
+            self._events.append((now, tokens))
+            self.stats["served"] += 1
+            return 0.0
+
+
+def embedding(text: str, dimensions: int) -> list:
+    rng = random.Random(hashlib.sha256(text.encode("utf-8")).digest())
+    return [rng.gauss(0, 1) for _ in range(dimensions)]
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """Answers /v1/embeddings and /v1/chat/completions in OpenAI's format,
+    with simulated latency and 429s once a limit is exceeded."""
+
+    server_version = "OpenAIStandIn/1.0"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, body: dict, headers: dict = None):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def throttle(self, window: RateWindow, tokens: int) -> bool:
+        wait = window.admit(tokens)
+        if not wait:
+            return False
+        self.send_json(
+            429,
+            {
+                "error": {
+                    "message": "Rate limit reached (simulated).",
+                    "type": "requests",
+                    "code": "rate_limit_exceeded",
+                }
+            },
+            {"retry-after": f"{wait:.2f}"},
+        )
+        return True
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        if self.path.endswith("/embeddings"):
+            self.embeddings(body)
+        elif self.path.endswith("/chat/completions"):
+            self.chat_completion(body)
+        else:
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+
+    def embeddings(self, body: dict):
+        inputs = body["input"] if isinstance(body["input"], list) else [body["input"]]
+        texts = [text if isinstance(text, str) else encoder.decode(text) for text in inputs]
+        tokens = sum(len(encoder.encode(text)) for text in texts)
+        if self.throttle(self.server.embedding_window, tokens):
+            return
+        time.sleep(self.server.embedding_latency + tokens / 1000000)
+
+        data = []
+        for position, text in enumerate(texts):
+            vector = embedding(text, self.server.dimensions)
+            if body.get("encoding_format") == "base64":
+                vector = base64.b64encode(array("f", vector).tobytes()).decode("ascii")
+            data.append({"object": "embedding", "index": position, "embedding": vector})
+        self.send_json(
+            200,
+            {
+                "object": "list",
+                "data": data,
+                "model": body.get("model"),
+                "usage": {"prompt_tokens": tokens, "total_tokens": tokens},
+            },
+        )
+
+    def chat_completion(self, body: dict):
+        prompt_tokens = sum(
+            len(encoder.encode(message.get("content") or ""))
+            for message in body["messages"]
+        )
+        words = [f"word{n}" for n in range(self.server.completion_words)]
+        content = json.dumps({"simulated": " ".join(words)})
+        completion_tokens = len(encoder.encode(content))
+        if self.throttle(self.server.llm_window, prompt_tokens + completion_tokens):
+            return
+        time.sleep(self.server.llm_latency)
+
+        response = {
+            "id": f"chatcmpl-{random.getrandbits(64):x}",
+            "created": int(time.time()),
+            "model": body.get("model"),
+        }
+        if not body.get("stream"):
+            self.send_json(
+                200,
+                {
+                    **response,
+                    "object": "chat.completion",
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": "stop",
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                    },
+                },
+            )
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.end_headers()
+        pieces = [content[start : start + 16] for start in range(0, len(content), 16)]
+        for position, piece in enumerate(pieces):
+            chunk = {
+                **response,
+                "object": "chat.completion.chunk",
+                "choices": [
+                    {
+                        "index": 0,
+                        "delta": {"role": "assistant", "content": piece},
+                        "finish_reason": "stop" if position == len(pieces) - 1 else None,
+                    }
+                ],
+            }
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+        self.wfile.write(b"data: [DONE]\n\n")
+
+
+def make_server(
+    host: str = "127.0.0.1",
+    port: int = 8089,
+    embedding_rpm: int = 60,
+    embedding_tpm: int = 100000,
+    embedding_latency: float = 0.2,
+    llm_rpm: int = 20,
+    llm_tpm: int = 40000,
+    llm_latency: float = 2.0,
+    completion_words: int = 300,
+    dimensions: int = 1536,
+    window_seconds: float = 60,
+    verbose: bool = False,
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), StandInHandler)
+    server.embedding_window = RateWindow(embedding_rpm, embedding_tpm, window_seconds)
+    server.llm_window = RateWindow(llm_rpm, llm_tpm, window_seconds)
+    server.embedding_latency = embedding_latency
+    server.llm_latency = llm_latency
+    server.completion_words = completion_words
+    server.dimensions = dimensions
+    server.verbose = verbose
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Local stand-in for the OpenAI API that simulates rate limits."
+    )
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--embedding-rpm", type=int, default=60)
+    parser.add_argument("--embedding-tpm", type=int, default=100000)
+    parser.add_argument("--embedding-latency", type=float, default=0.2)
+    parser.add_argument("--llm-rpm", type=int, default=20)
+    parser.add_argument("--llm-tpm", type=int, default=40000)
+    parser.add_argument("--llm-latency", type=float, default=2.0)
+    parser.add_argument("--completion-words", type=int, default=300)
+    parser.add_argument("--dimensions", type=int, default=1536)
+    parser.add_argument("--window-seconds", type=float, default=60)
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args(argv)
+
+    server = make_server(**vars(args))
+    print(f"Serving on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(
+            json.dumps(
+                {
+                    "embeddings": server.embedding_window.stats,
+                    "chat_completions": server.llm_window.stats,
+                }
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,138 @@
+import json
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import pypdf
+
+page_cache_directory = os.getenv("PAGE_CACHE_DIR", "./page_cache/")
+pdf_workers = int(os.getenv("PDF_WORKERS", str(os.cpu_count() or 1)))
+pages_per_task = int(os.getenv("PDF_PAGES_PER_TASK", "8"))
+
+
+def extract_pages(file_path: str, start: int, stop: int) -> list:
+    # Runs in a worker process, so it only depends on pypdf.
+    reader = pypdf.PdfReader(file_path)
+    labels = reader.page_labels
+    return [
+        {"label": labels[number], "text": reader.pages[number].extract_text() or ""}
+        for number in range(start, stop)
+    ]
+
+
+def page_count(file_path: str) -> int:
+    return len(pypdf.PdfReader(file_path).pages)
+
+
+def page_cache_path(content_hash: str, page_number: int) -> str:
+    return os.path.join(page_cache_directory, content_hash, f"{page_number}.json")
+
+
+def read_cached_page(file_path: str, content_hash: str, page_number: int) -> dict:
+    try:
+        with open(page_cache_path(content_hash, page_number)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return extract_pages(file_path, page_number, page_number + 1)[0]
+
+
+def write_cached_page(content_hash: str, page_number: int, page: dict):
+    path = page_cache_path(content_hash, page_number)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "w") as f:
+        json.dump(page, f)
+    os.replace(temp_path, path)
+
+
+def plan_segments(content_hash: str, total_pages: int) -> list:
+    # Cached pages are read directly; runs of uncached pages are split into
+    # tasks of at most pages_per_task pages each.
+    segments = []
+    run_start = None
+    for page_number in range(total_pages + 1):
+        cached = page_number < total_pages and os.path.exists(
+            page_cache_path(content_hash, page_number)
+        )
+        uncached = page_number < total_pages and not cached
+        if uncached and run_start is None:
+            run_start = page_number
+        if run_start is not None and (not uncached or page_number - run_start == pages_per_task):
+            segments.append(("extract", run_start, page_number))
+            run_start = page_number if uncached else None
+        if cached:
+            segments.append(("cached", page_number, page_number + 1))
+    return segments
+
+
+def page_document(file_path: str, content_hash: str, page_number: int, page: dict):
+    # Imported here so spawned extraction workers don't load llama-index.
+    from llama_index.core import Document
+
+    return Document(
+        doc_id=f"{content_hash}-page-{page_number}",
+        text=page["text"],
+        metadata={
+            "page_label": page["label"],
+            "file_name": os.path.basename(file_path),
+        },
+    )
+
+
+def iter_page_documents(file_path: str, content_hash: str, workers: int = pdf_workers):
+    """Yield one Document per page, in page order, as soon as each is ready.
+
+    At most ``2 * workers`` extraction tasks are in flight, so memory stays
+    bounded no matter how many pages the file has.
+    """
+    total_pages = page_count(file_path)
+    segments = plan_segments(content_hash, total_pages)
+    extract_tasks = sum(1 for kind, _, _ in segments if kind == "extract")
+
+    if extract_tasks <= 1 or workers <= 1:
+        for kind, start, stop in segments:
+            pages = (
+                [read_cached_page(file_path, content_hash, start)]
+                if kind == "cached"
+                else extract_pages(file_path, start, stop)
+            )
+            for page_number, page in zip(range(start, stop), pages):
+                if kind == "extract":
+                    write_cached_page(content_hash, page_number, page)
+                yield page_document(file_path, content_hash, page_number, page)
+        return
+
+    # Spawn rather than fork, the Streamlit server process is multi-threaded.
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(
+        max_workers=min(workers, extract_tasks), mp_context=context
+    ) as executor:
+        in_flight = deque()
+        upcoming = iter(segments)
+
+        def submit_next() -> bool:
+            segment = next(upcoming, None)
+            if segment is None:
+                return False
+            kind, start, stop = segment
+            future = None
+            if kind == "extract":
+                future = executor.submit(extract_pages, file_path, start, stop)
+            in_flight.append((segment, future))
+            return True
+
+        while len(in_flight) < 2 * workers and submit_next():
+            pass
+
+        while in_flight:
+            (kind, start, stop), future = in_flight.popleft()
+            if kind == "cached":
+                pages = [read_cached_page(file_path, content_hash, start)]
+            else:
+                pages = future.result()
+            submit_next()
+            for page_number, page in zip(range(start, stop), pages):
+                if kind == "extract":
+                    write_cached_page(content_hash, page_number, page)
+                yield page_document(file_path, content_hash, page_number, page)
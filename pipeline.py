@@ -0,0 +1,686 @@
+from llama_index.llms.openai import OpenAI
+from llama_index.core import (
+    PromptHelper,
+    Settings,
+    StorageContext,
+    VectorStoreIndex,
+    get_response_synthesizer,
+)
+from llama_index.core.ingestion import run_transformations
+from llama_index.core.query_engine import RetrieverQueryEngine
+from llama_index.core.response_synthesizers import ResponseMode
+from llama_index.embeddings.openai import OpenAIEmbedding
+from llama_index.core.callbacks import CallbackManager
+from llama_index.core.schema import QueryBundle
+from llama_index.core.vector_stores.types import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+)
+from dotenv import load_dotenv
+from boilerplate import DocumentCleaner
+from callbacks import LedgerHandler, TracingHandler
+from context_budget import select_context
+from embedding_cache import CachedEmbedding
+from index_cache import (
+    cache_key,
+    file_hash,
+    load_cached_index,
+    read_entry_metadata,
+    register_source,
+    store_index,
+)
+from prompts import (
+    DOMAIN_CONTEXT_SOURCES,
+    DOMAIN_LEXICAL_QUERIES,
+    DOMAIN_RETRIEVAL_POLICIES,
+    DOMAIN_RETRIEVAL_QUERIES,
+    DOMAIN_SECTIONS,
+    DOMAINS,
+    PRIOR_DOMAINS_PROMPT,
+    REPAIR_JSON_PROMPT,
+    REPAIR_PART_PROMPT,
+    SCHEMA_DEFINITIONS,
+    render_compact_prompt,
+    render_full_prompt,
+    strip_schema,
+)
+from hybrid_retrieval import HybridRetriever
+from index_bundle import (
+    bundle_directory,
+    bundle_manifest,
+    bundle_path,
+    load_bundle,
+    write_bundle,
+)
+from index_registry import IndexRegistry
+from ledger import UsageLedger
+from model_settings import (
+    embed_model_name,
+    llm_model_name,
+    model_cost_information,
+)
+from pdf_reader import iter_page_documents, page_count
+from rate_limit import RateLimitedTransport, limiter_from_env
+from response_cache import ResponseCache, response_key
+from retrieval_plan import PlannedRetriever, RetrievalPlan, RetrievalPlans
+from schema_validation import format_path, subschema, validate
+from sections import SectionSplitter
+from trace_context import trace_tags
+from tracing import tracer
+from vector_store import MmapVectorStore, vector_store_dtype
+from functools import lru_cache
+import httpx
+import tiktoken
+import json
+import os
+import shutil
+import sys
+import time
+
+load_dotenv()
+
+domain_timeout = float(os.getenv("DOMAIN_TIMEOUT", "180"))
+compact_prompts = os.getenv("PROMPT_SCHEMA_MODE", "compact") == "compact"
+schema_repair_attempts = int(os.getenv("SCHEMA_REPAIR_ATTEMPTS", "2"))
+
+tokenizer = tiktoken.encoding_for_model(llm_model_name).encode
+# One rate limited HTTP client for every OpenAI call in the process, so all
+# sessions, jobs and batch workers share the same budgets.
+rate_limiters = {
+    "/embeddings": limiter_from_env("OPENAI_EMBEDDING", 3000, 1000000, 8, 10.0),
+    "/chat/completions": limiter_from_env("OPENAI_LLM", 500, 150000, 16),
+}
+openai_http_client = httpx.Client(
+    transport=RateLimitedTransport(rate_limiters, lambda text: len(tokenizer(text))),
+    timeout=domain_timeout,
+)
+embed_model = CachedEmbedding(
+    OpenAIEmbedding(
+        model=embed_model_name, http_client=openai_http_client, max_retries=0
+    ),
+    tokenizer=tokenizer,
+)
+
+domain_labels = {
+    "usability": "usability",
+    "io": "IO",
+    "description": "description",
+    "execution": "execution",
+    "parametric": "parametric",
+    "error": "error",
+}
+domain_prompts = {
+    domain: (
+        label,
+        render_compact_prompt(domain, lambda text: len(tokenizer(text)))
+        if compact_prompts
+        else render_full_prompt(domain),
+    )
+    for domain, label in domain_labels.items()
+}
+
+usage_ledger = UsageLedger(pricing=model_cost_information)
+ledger_handler = LedgerHandler(usage_ledger, tokenizer, llm_model_name, embed_model_name)
+Settings.llm = OpenAI(
+    model=llm_model_name,
+    timeout=domain_timeout,
+    http_client=openai_http_client,
+    max_retries=0,
+)
+Settings.callback_manager = CallbackManager([TracingHandler(tracer), ledger_handler])
+Settings.embed_model = embed_model
+# Domains ranked by embeddings and BM25 fused. Their answers hinge on exact
+# identifiers, so the fused top chunks are precise enough for a smaller top-k.
+hybrid_domains = {
+    domain
+    for domain in os.getenv("HYBRID_RETRIEVAL_DOMAINS", "io,execution,parametric").split(",")
+    if domain
+}
+hybrid_retrieval_settings = {"candidates": int(os.getenv("HYBRID_CANDIDATES", "8"))}
+# No synthesis call's prompt may go over this, refine passes included.
+max_prompt_tokens = int(os.getenv("MAX_PROMPT_TOKENS", "8000"))
+# Room for the QA template's own text around the query and the context.
+prompt_template_tokens = 150
+ingest_batch_pages = int(os.getenv("INGEST_BATCH_PAGES", "16"))
+# Token ceiling for each earlier domain's output passed to a later one.
+domain_context_max_tokens = int(os.getenv("DOMAIN_CONTEXT_MAX_TOKENS", "300"))
+response_cache = ResponseCache()
+index_registry = IndexRegistry()
+retrieval_plans = RetrievalPlans()
+
+
+def index_parameters() -> dict:
+    return {
+        "embed_model_name": embed_model_name,
+        "chunk_size": Settings.chunk_size,
+        "chunk_overlap": Settings.chunk_overlap,
+        "storage_format": f"mmap-bm25-{vector_store_dtype}",
+        "chunker": "sections-deduped",
+    }
+
+
+def document_key(content_hash: str) -> str:
+    return cache_key([content_hash], **index_parameters())
+
+
+def build_index(
+    file_path: str,
+    content_hash: str,
+    on_progress=None,
+    cleaner: DocumentCleaner = None,
+):
+    """``on_progress(pages_parsed=, total_pages=, chunks_embedded=)`` is
+    called after each batch is inserted, and may raise to stop the build.
+    Pass a ``cleaner`` to read its report of the boilerplate removed."""
+    storage_context = StorageContext.from_defaults(vector_store=MmapVectorStore())
+    index = VectorStoreIndex(nodes=[], storage_context=storage_context)
+    # Pages are chunked and embedded in batches as extraction finishes them,
+    # instead of after the whole file has been parsed.
+    pages = iter_page_documents(file_path, content_hash)
+    total_pages = page_count(file_path)
+    # Pages are split at section headings before chunking, so every chunk
+    # carries a "section" and the references are never embedded.
+    splitter = SectionSplitter(total_pages)
+    # Running headers, footers and copyright lines are stripped before
+    # chunking, and repeated chunks dropped before embedding.
+    cleaner = cleaner or DocumentCleaner(lambda text: len(tokenizer(text)))
+    load_seconds = 0.0
+    pages_parsed = 0
+    chunks_embedded = 0
+    batch = []
+    while True:
+        started = time.perf_counter()
+        document = next(pages, None)
+        load_seconds += time.perf_counter() - started
+        if document is not None:
+            batch.append(document)
+        if batch and (document is None or len(batch) == ingest_batch_pages):
+            sections = [
+                part for page in cleaner.clean_pages(batch) for part in splitter.split(page)
+            ]
+            nodes = cleaner.dedupe_nodes(
+                run_transformations(sections, Settings.transformations)
+            )
+            index.insert_nodes(nodes)
+            pages_parsed += len(batch)
+            chunks_embedded += len(nodes)
+            batch = []
+            if on_progress is not None:
+                try:
+                    on_progress(
+                        pages_parsed=pages_parsed,
+                        total_pages=total_pages,
+                        chunks_embedded=chunks_embedded,
+                    )
+                except BaseException:
+                    pages.close()
+                    raise
+        if document is None:
+            break
+    # Time spent waiting on extraction, excluding chunking and embedding.
+    tracer.record("pdf_load", load_seconds)
+    return index
+
+
+def load_or_build_index(file_path: str, content_hash: str = None, on_progress=None):
+    content_hash = content_hash or file_hash(file_path)
+    key = document_key(content_hash)
+    with trace_tags(document=key):
+        with tracer.span("index_load"):
+            index = load_cached_index(key)
+        if index is None and os.path.exists(bundle_path(key)):
+            # Papers indexed ahead of time ship as bundles, mapped in place.
+            try:
+                with tracer.span("bundle_load"):
+                    index = load_bundle(key)
+            except Exception as e:
+                # A corrupt or outdated bundle is no worse than none at all.
+                print(f"Could not load {bundle_path(key)}, rebuilding: {e}", file=sys.stderr)
+            if index is not None:
+                tracer.write_prometheus_textfile()
+                return key, index
+        if index is None:
+            with tracer.span("index_build"):
+                cleaner = DocumentCleaner(lambda text: len(tokenizer(text)))
+                index = build_index(file_path, content_hash, on_progress, cleaner)
+                store_index(
+                    key,
+                    index,
+                    {"files": [os.path.abspath(file_path)], "cleaning": cleaner.report},
+                )
+        else:
+            register_source(key, os.path.abspath(file_path))
+    tracer.write_prometheus_textfile()
+    return key, index
+
+
+def cleaning_report(key: str) -> dict:
+    """Boilerplate lines and chunks removed while building the index."""
+    try:
+        return read_entry_metadata(key).get("cleaning", {})
+    except (OSError, ValueError):
+        pass
+    try:
+        manifest = bundle_manifest(key)
+    except (OSError, ValueError):
+        return {}
+    return manifest.get("cleaning", {}) if manifest else {}
+
+
+def export_bundle(file_path: str, directory: str = bundle_directory) -> str:
+    """Indexes ``file_path``, unless it already is, and writes its bundle to
+    ``directory``. Returns the bundle's path."""
+    content_hash = file_hash(file_path)
+    key, _ = load_or_build_index(file_path, content_hash)
+    try:
+        metadata = read_entry_metadata(key)
+    except OSError:
+        # Loaded from a bundle rather than the cache, so ship that one on.
+        destination = bundle_path(key, directory)
+        if os.path.abspath(destination) != os.path.abspath(bundle_path(key)):
+            os.makedirs(directory, exist_ok=True)
+            shutil.copyfile(bundle_path(key), destination)
+        return destination
+    return write_bundle(
+        key,
+        {
+            "content_hash": content_hash,
+            **index_parameters(),
+            "pages": page_count(file_path),
+            "cleaning": metadata.get("cleaning", {}),
+        },
+        directory,
+    )
+
+
+def get_index(
+    file_path: str, key: str = None, session: str = None, on_progress=None
+):
+    """Like ``load_or_build_index`` but served from the in-memory registry."""
+    key = key or document_key(file_hash(file_path))
+    index = index_registry.get(
+        key,
+        lambda: load_or_build_index(file_path, on_progress=on_progress)[1],
+        session=session,
+    )
+    return key, index
+
+
+def generation_order(domains) -> list:
+    """``domains`` reordered so context sources come before the domains that
+    use them."""
+    ordered = []
+
+    def add(domain: str):
+        if domain in ordered:
+            return
+        for source in DOMAIN_CONTEXT_SOURCES.get(domain, ()):
+            if source in domains:
+                add(source)
+        ordered.append(domain)
+
+    for domain in domains:
+        add(domain)
+    return ordered
+
+
+def domain_query_text(domain: str) -> str:
+    label, schema = domain_prompts[domain]
+    return f"Can you give me a Biocompute Object {label} domain for the provided paper. The JSON return response must be valid against the JSON schema I am providing you. {schema}"
+
+
+@lru_cache(maxsize=None)
+def retrieval_embedding(domain: str) -> tuple:
+    # The retrieval queries are fixed, so each is embedded once per process.
+    return tuple(embed_model.get_query_embedding(DOMAIN_RETRIEVAL_QUERIES[domain]))
+
+
+def domain_query_bundle(domain: str, context: str = "") -> QueryBundle:
+    query_str = domain_query_text(domain)
+    if context:
+        query_str += "\n\n" + PRIOR_DOMAINS_PROMPT.format(context=context)
+    return QueryBundle(
+        query_str=query_str,
+        custom_embedding_strs=[DOMAIN_RETRIEVAL_QUERIES[domain]],
+        embedding=list(retrieval_embedding(domain)),
+    )
+
+
+def domain_retrieval_settings(index, domain: str) -> dict:
+    """Retrieval settings restricting the search to the domain's sections.
+
+    Falls back to the whole paper when none of its chunks are in them.
+    """
+    settings = {"similarity_top_k": DOMAIN_RETRIEVAL_POLICIES[domain]["max_chunks"]}
+    if domain in hybrid_domains:
+        settings.update(hybrid_retrieval_settings)
+    sections = DOMAIN_SECTIONS[domain]
+    present = {node.metadata.get("section") for node in index.docstore.docs.values()}
+    if present.isdisjoint(sections):
+        return settings
+    return {
+        **settings,
+        "filters": MetadataFilters(
+            filters=[
+                MetadataFilter(
+                    key="section", value=list(sections), operator=FilterOperator.IN
+                )
+            ]
+        ),
+    }
+
+
+def domain_retriever(index, domain: str):
+    settings = domain_retrieval_settings(index, domain)
+    if domain in hybrid_domains:
+        return HybridRetriever(
+            index,
+            DOMAIN_LEXICAL_QUERIES[domain],
+            score_cutoff=DOMAIN_RETRIEVAL_POLICIES[domain]["score_cutoff"],
+            **settings,
+        )
+    return index.as_retriever(**settings)
+
+
+def retrieval_plan(index) -> RetrievalPlan:
+    """Retrieves for every domain at once, the first time any domain of the
+    document is generated."""
+
+    def retrieve(domain: str):
+        return domain_retriever(index, domain).retrieve(domain_query_bundle(domain))
+
+    return retrieval_plans.get(index, lambda: RetrievalPlan(retrieve, domain_prompts))
+
+
+def compact_output(data, max_tokens: int = domain_context_max_tokens) -> str:
+    """A domain's JSON as ``path: value`` lines, cut off at ``max_tokens``."""
+
+    def leaves(value, path: tuple):
+        if isinstance(value, dict):
+            for key, item in value.items():
+                yield from leaves(item, path + (key,))
+        elif isinstance(value, list):
+            for position, item in enumerate(value):
+                yield from leaves(item, path + (position,))
+        elif value not in (None, ""):
+            yield path, value
+
+    lines = []
+    used = 0
+    for path, value in leaves(data, ()):
+        line = f"{format_path(path)}: {value}"
+        used += len(tokenizer(line))
+        if used > max_tokens:
+            break
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def domain_context(document_key: str, domain: str):
+    """Returns ``(context, sources)``: the compact outputs of the domain's
+    ``DOMAIN_CONTEXT_SOURCES`` already in the response cache, and which
+    sources those were."""
+    parts = []
+    sources = []
+    if document_key is None:
+        return "", sources
+    for source in DOMAIN_CONTEXT_SOURCES.get(domain, ()):
+        cached = response_cache.get(domain_response_key(document_key, source))
+        if cached is None:
+            continue
+        try:
+            data = extract_json(cached)
+        except ValueError:
+            continue
+        parts.append(f"{domain_labels[source]} domain:\n{compact_output(data)}")
+        sources.append(source)
+    return "\n\n".join(parts), sources
+
+
+def selection_cutoff(domain: str):
+    # Fused ranks can't take a relative cutoff: a chunk found by one ranking
+    # scores half of one found by both. Hybrid domains cut their dense
+    # scores before fusion instead.
+    if domain in hybrid_domains:
+        return None
+    return DOMAIN_RETRIEVAL_POLICIES[domain]["score_cutoff"]
+
+
+def domain_context_budget(query_bundle: QueryBundle, domain: str) -> int:
+    """The domain's context tokens, lowered so the prompt stays under
+    ``max_prompt_tokens``."""
+    query_tokens = len(tokenizer(query_bundle.query_str)) + prompt_template_tokens
+    return max(
+        0,
+        min(DOMAIN_RETRIEVAL_POLICIES[domain]["context_tokens"], max_prompt_tokens - query_tokens),
+    )
+
+
+def domain_query_engine(nodes: list, streaming: bool = False) -> RetrieverQueryEngine:
+    # Compact packs the chunks into as few calls as fit under the ceiling,
+    # which is a single one unless the selection chose to refine.
+    synthesizer = get_response_synthesizer(
+        response_mode=ResponseMode.COMPACT,
+        prompt_helper=PromptHelper(context_window=max_prompt_tokens, num_output=0),
+        streaming=streaming,
+    )
+    return RetrieverQueryEngine.from_args(
+        PlannedRetriever(nodes), response_synthesizer=synthesizer
+    )
+
+
+def domain_response_key(document_key: str, domain: str, context: str = None) -> str:
+    if context is None:
+        context = domain_context(document_key, domain)[0]
+    return response_key(
+        document_key,
+        domain,
+        domain_query_text(domain) + DOMAIN_RETRIEVAL_QUERIES[domain] + context,
+        llm_model_name,
+        {
+            **DOMAIN_RETRIEVAL_POLICIES[domain],
+            **(
+                {**hybrid_retrieval_settings, "lexical": DOMAIN_LEXICAL_QUERIES[domain]}
+                if domain in hybrid_domains
+                else {}
+            ),
+            "sections": DOMAIN_SECTIONS[domain],
+            "max_prompt_tokens": max_prompt_tokens,
+        },
+    )
+
+
+def query_domain(
+    index,
+    domain: str,
+    document_key: str = None,
+    refresh: bool = False,
+    on_token=None,
+):
+    """Returns ``(response, from_cache, cache_key)``, where ``cache_key`` is
+    the response cache entry it was stored under, if any. With ``on_token``
+    the response is streamed, and each new piece of text is passed to it as
+    it arrives.
+
+    Chunks come from the document's retrieval plan, cut down to the domain's
+    policy in ``DOMAIN_RETRIEVAL_POLICIES``. Outputs of the domain's context
+    sources already generated are passed along in the prompt.
+    """
+
+    context, sources = domain_context(document_key, domain)
+
+    def compute() -> str:
+        # Chunks the context domains were generated from are already
+        # summarized in the context.
+        plan = retrieval_plan(index)
+        query_bundle = domain_query_bundle(domain, context)
+        policy = DOMAIN_RETRIEVAL_POLICIES[domain]
+        started = time.perf_counter()
+        selection = select_context(
+            plan.slice(domain, plan.node_ids(sources)),
+            domain_context_budget(query_bundle, domain),
+            selection_cutoff(domain),
+            policy["refine"],
+            lambda text: len(tokenizer(text)),
+        )
+        tracer.record(
+            "context_selection",
+            time.perf_counter() - started,
+            synthesis_mode=selection["mode"],
+            chunks=len(selection["nodes"]),
+            context_tokens=selection["context_tokens"],
+        )
+        if on_token is None:
+            query_engine = domain_query_engine(selection["nodes"])
+            return str(query_engine.query(query_bundle))
+
+        query_engine = domain_query_engine(selection["nodes"], streaming=True)
+        tokens = query_engine.query(query_bundle).response_gen
+        text = ""
+        try:
+            for token in tokens:
+                text += token
+                on_token(token)
+        finally:
+            # Release the upstream stream if on_token raised to stop early.
+            tokens.close()
+        return text
+
+    with trace_tags(document=document_key, domain=domain):
+        if document_key is None:
+            cache_key = None
+            response, from_cache = compute(), False
+        else:
+            cache_key = domain_response_key(document_key, domain, context)
+            response, from_cache = response_cache.get_or_compute(
+                cache_key, compute, refresh=refresh
+            )
+            if from_cache:
+                usage_ledger.record("llm_cache_hit", llm_model_name)
+    tracer.write_prometheus_textfile()
+    return response, from_cache, cache_key
+
+
+def extract_json(query_response: str):
+    text = query_response.strip()
+    if text.startswith("```"):
+        text = text.split("\n", 1)[1] if "\n" in text else ""
+        if text.rstrip().endswith("```"):
+            text = text.rstrip()[:-3]
+    return json.loads(text)
+
+
+def validate_domain(domain: str, text: str):
+    """Returns ``(data, errors)``, where ``data`` is None if ``text`` isn't JSON."""
+    try:
+        data = extract_json(text)
+    except ValueError as e:
+        return None, [{"path": (), "keyword": "json", "message": f"is not valid JSON ({e})"}]
+    return data, validate(data, DOMAINS[domain][1], SCHEMA_DEFINITIONS)
+
+
+def describe_errors(errors: list) -> str:
+    return "; ".join(
+        f"{format_path(error['path']) or 'the response'} {error['message']}"
+        for error in errors
+    )
+
+
+def compact_schema(schema: dict) -> str:
+    return json.dumps(
+        strip_schema(schema, keep_examples=False, max_description_chars=160),
+        separators=(",", ":"),
+        ensure_ascii=False,
+    )
+
+
+def repair_context(index, domain: str) -> str:
+    policy = DOMAIN_RETRIEVAL_POLICIES[domain]
+    nodes = select_context(
+        retrieval_plan(index).slice(domain),
+        policy["context_tokens"],
+        selection_cutoff(domain),
+        False,
+        lambda text: len(tokenizer(text)),
+    )["nodes"]
+    return "\n\n".join(node.get_content() for node in nodes)
+
+
+def repair_part(domain: str, data, part: tuple, errors: list, context: str):
+    key = part[0]
+    if isinstance(key, str) and all(
+        error["keyword"] == "additionalProperties" and error["path"] == part
+        for error in errors
+    ):
+        # An unexpected key is simply dropped, no call needed.
+        del data[key]
+        return True
+
+    current = data.get(key) if isinstance(data, dict) else data[key]
+    schema = subschema(DOMAINS[domain][1], part, SCHEMA_DEFINITIONS)
+    prompt = REPAIR_PART_PROMPT.format(
+        context=context,
+        label=domain_labels[domain],
+        path=format_path(part),
+        errors=describe_errors(errors),
+        value=json.dumps(current, ensure_ascii=False),
+        schema=compact_schema(schema),
+    )
+    try:
+        data[key] = extract_json(Settings.llm.complete(prompt).text)
+    except ValueError:
+        return False
+    return True
+
+
+def repair_domain(
+    index, domain: str, text: str, document_key: str = None, cache_key: str = None
+):
+    """Validate a domain response against its schema and regenerate only the
+    parts that fail, each with a small focused prompt.
+
+    Returns ``(data, errors, repaired)``: the final JSON (None if it never
+    parsed), any errors left after ``schema_repair_attempts`` rounds, and the
+    paths that were regenerated. A repaired response replaces ``text`` under
+    ``cache_key``, the key ``query_domain`` returned with it. Repair calls are
+    recorded in the ledger as ``llm_repair`` and traced as ``schema_repair``
+    spans.
+    """
+    schema = DOMAINS[domain][1]
+    data, errors = validate_domain(domain, text)
+    repaired = []
+    context = None
+    with trace_tags(document=document_key, domain=domain, usage_kind="llm_repair"):
+        for _ in range(schema_repair_attempts):
+            if not errors:
+                break
+            with tracer.span("schema_repair"):
+                if data is None or any(not error["path"] for error in errors):
+                    # Nothing smaller to target, so the model fixes its own
+                    # output without retrieval.
+                    text = Settings.llm.complete(
+                        REPAIR_JSON_PROMPT.format(
+                            label=domain_labels[domain],
+                            errors=describe_errors(errors),
+                            text=text,
+                            schema=compact_schema(schema),
+                        )
+                    ).text
+                    data, errors = validate_domain(domain, text)
+                    repaired.append("(whole response)")
+                    continue
+
+                parts = {}
+                for error in errors:
+                    parts.setdefault(error["path"][:1], []).append(error)
+                for part, part_errors in parts.items():
+                    if context is None:
+                        context = repair_context(index, domain)
+                    if repair_part(domain, data, part, part_errors, context):
+                        repaired.append(format_path(part))
+                errors = validate(data, schema, SCHEMA_DEFINITIONS)
+
+    if repaired and data is not None and cache_key is not None:
+        response_cache.put(cache_key, json.dumps(data, indent=4))
+    return data, errors, repaired
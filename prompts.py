@@ -1,7 +1,10 @@
-USABILITY_DOMAIN = """The Usability domain in a BioCompute Object is a plain languages description
+import json
+
+USABILITY_OVERVIEW = """The Usability domain in a BioCompute Object is a plain languages description
 of what was done in the project or paper workflow. The Usasability domain conveys the purpose
-of the Biocompute Object. The JSON schema is as follows:
-{
+of the Biocompute Object. """
+
+USABILITY_SCHEMA = {
     "$schema": "http://json-schema.org/draft-07/schema#",
     "$id": "https://w3id.org/ieee/ieee-2791-schema/usability_domain.json",
     "type": "array",
@@ -13,16 +16,16 @@ of the Biocompute Object. The JSON schema is as follows:
         "examples": [
             "Identify baseline single nucleotide polymorphisms SNPs [SO:0000694], insertions [so:SO:0000667], and deletions [so:SO:0000045] that correlate with reduced ledipasvir [pubchem.compound:67505836] antiviral drug efficacy in Hepatitis C virus subtype 1 [taxonomy:31646]",
             "Identify treatment emergent amino acid substitutions [so:SO:0000048] that correlate with antiviral drug treatment failure",
-            "Determine whether the treatment emergent amino acid substitutions [so:SO:0000048] identified correlate with treatment failure involving other drugs against the same virus"
-        ]
-    }
+            "Determine whether the treatment emergent amino acid substitutions [so:SO:0000048] identified correlate with treatment failure involving other drugs against the same virus",
+        ],
+    },
 }
-"""
 
-IO_DOMAIN = """The Input Output domain (or IO domain) represents the list of global input and output files created by the computational workflow,
+IO_OVERVIEW = """The Input Output domain (or IO domain) represents the list of global input and output files created by the computational workflow,
 excluding the intermediate files. These fields are pointers to objects that can reside in the system performing
-the ecomputation or any other accessible system. The JSON schema is as follows:
-{
+the ecomputation or any other accessible system. """
+
+IO_SCHEMA = {
     "$schema": "http://json-schema.org/draft-07/schema#",
     "$id": "https://w3id.org/ieee/ieee-2791-schema/io_domain.json",
     "type": "object",
@@ -30,7 +33,7 @@ the ecomputation or any other accessible system. The JSON schema is as follows:
     "description": "The list of global input and output files created by the computational workflow, excluding the intermediate files. Custom to every specific IEEE-2791 Object implementation, these fields are pointers to objects that can reside in the system performing the computation or any other accessible system.",
     "required": [
         "input_subdomain",
-        "output_subdomain"
+        "output_subdomain",
     ],
     "properties": {
         "input_subdomain": {
@@ -38,17 +41,17 @@ the ecomputation or any other accessible system. The JSON schema is as follows:
             "title": "input_domain",
             "description": "A record of the references and input files for the entire pipeline. Each type of input file is listed under a key for that type.",
             "items": {
-                "additionalProperties": false,
+                "additionalProperties": False,
                 "type": "object",
                 "required": [
-                    "uri"
+                    "uri",
                 ],
                 "properties": {
                     "uri": {
-                        "$ref": "2791object.json#/definitions/uri"
-                    }
-                }
-            }
+                        "$ref": "2791object.json#/definitions/uri",
+                    },
+                },
+            },
         },
         "output_subdomain": {
             "type": "array",
@@ -59,7 +62,7 @@ the ecomputation or any other accessible system. The JSON schema is as follows:
                 "title": "The Items Schema",
                 "required": [
                     "mediatype",
-                    "uri"
+                    "uri",
                 ],
                 "properties": {
                     "mediatype": {
@@ -68,24 +71,24 @@ the ecomputation or any other accessible system. The JSON schema is as follows:
                         "description": "https://www.iana.org/assignments/media-types/",
                         "default": "application/octet-stream",
                         "examples": [
-                            "text/csv"
+                            "text/csv",
                         ],
-                        "pattern": "^(.*)$"
+                        "pattern": "^(.*)$",
                     },
                     "uri": {
-                        "$ref": "2791object.json#/definitions/uri"
-                    }
-                }
-            }
-        }
-    }
+                        "$ref": "2791object.json#/definitions/uri",
+                    },
+                },
+            },
+        },
+    },
 }
-"""
 
-DESCRIPTION_DOMAIN = """The description domain specifies structured fields for the description of external
+DESCRIPTION_OVERVIEW = """The description domain specifies structured fields for the description of external
 resources, the pipeline steps, and the relationship of I/O objects. Information in this domain is not used
-for computation. The JSON schema is as follows:
-{
+for computation. """
+
+DESCRIPTION_SCHEMA = {
     "$schema": "http://json-schema.org/draft-07/schema#",
     "$id": "https://w3id.org/ieee/ieee-2791-schema/description_domain.json",
     "type": "object",
@@ -93,7 +96,7 @@ for computation. The JSON schema is as follows:
     "description": "Structured field for description of external references, the pipeline steps, and the relationship of I/O objects.",
     "required": [
         "keywords",
-        "pipeline_steps"
+        "pipeline_steps",
     ],
     "properties": {
         "keywords": {
@@ -107,9 +110,9 @@ for computation. The JSON schema is as follows:
                     "Ledipasvir",
                     "antiviral resistance",
                     "SNP",
-                    "amino acid substitutions"
-                ]
-            }
+                    "amino acid substitutions",
+                ],
+            },
         },
         "xref": {
             "type": "array",
@@ -122,22 +125,22 @@ for computation. The JSON schema is as follows:
                     "namespace",
                     "name",
                     "ids",
-                    "access_time"
+                    "access_time",
                 ],
                 "properties": {
                     "namespace": {
                         "type": "string",
                         "description": "External resource vendor prefix",
                         "examples": [
-                            "pubchem.compound"
-                        ]
+                            "pubchem.compound",
+                        ],
                     },
                     "name": {
                         "type": "string",
                         "description": "Name of external reference",
                         "examples": [
-                            "PubChem-compound"
-                        ]
+                            "PubChem-compound",
+                        ],
                     },
                     "ids": {
                         "type": "array",
@@ -146,17 +149,17 @@ for computation. The JSON schema is as follows:
                             "type": "string",
                             "description": "Reference identifier",
                             "examples": [
-                                "67505836"
-                            ]
-                        }
+                                "67505836",
+                            ],
+                        },
                     },
                     "access_time": {
                         "type": "string",
                         "description": "Date and time the external reference was accessed",
-                        "format": "date-time"
-                    }
-                }
-            }
+                        "format": "date-time",
+                    },
+                },
+            },
         },
         "platform": {
             "type": "array",
@@ -164,48 +167,48 @@ for computation. The JSON schema is as follows:
             "items": {
                 "type": "string",
                 "examples": [
-                    "hive"
-                ]
-            }
+                    "hive",
+                ],
+            },
         },
         "pipeline_steps": {
             "type": "array",
             "description": "Each individual tool (or a well defined and reusable script) is represented as a step. Parallel processes are given the same step number.",
             "items": {
-                "additionalProperties": false,
+                "additionalProperties": False,
                 "type": "object",
                 "required": [
                     "step_number",
                     "name",
                     "description",
                     "input_list",
-                    "output_list"
+                    "output_list",
                 ],
                 "properties": {
                     "step_number": {
                         "type": "integer",
-                        "description": "Non-negative integer value representing the position of the tool in a one-dimensional representation of the pipeline."
+                        "description": "Non-negative integer value representing the position of the tool in a one-dimensional representation of the pipeline.",
                     },
                     "name": {
                         "type": "string",
                         "description": "This is a recognized name of the software tool",
                         "examples": [
-                            "HIVE-hexagon"
-                        ]
+                            "HIVE-hexagon",
+                        ],
                     },
                     "description": {
                         "type": "string",
                         "description": "Specific purpose of the tool.",
                         "examples": [
-                            "Alignment of reads to a set of references"
-                        ]
+                            "Alignment of reads to a set of references",
+                        ],
                     },
                     "version": {
                         "type": "string",
                         "description": "Version assigned to the instance of the tool used corresponding to the upstream release.",
                         "examples": [
-                            "1.3"
-                        ]
+                            "1.3",
+                        ],
                     },
                     "prerequisite": {
                         "type": "array",
@@ -215,46 +218,46 @@ for computation. The JSON schema is as follows:
                             "description": "Text value to indicate a package or prerequisite for running the tool used.",
                             "required": [
                                 "name",
-                                "uri"
+                                "uri",
                             ],
                             "properties": {
                                 "name": {
                                     "type": "string",
                                     "description": "Public searchable name for reference or prereq.",
                                     "examples": [
-                                        "Hepatitis C virus genotype 1"
-                                    ]
+                                        "Hepatitis C virus genotype 1",
+                                    ],
                                 },
                                 "uri": {
-                                    "$ref": "2791object.json#/definitions/uri"
-                                }
-                            }
-                        }
+                                    "$ref": "2791object.json#/definitions/uri",
+                                },
+                            },
+                        },
                     },
                     "input_list": {
                         "type": "array",
                         "description": "URIs (expressed as a URN or URL) of the input files for each tool.",
                         "items": {
-                            "$ref": "2791object.json#/definitions/uri"
-                        }
+                            "$ref": "2791object.json#/definitions/uri",
+                        },
                     },
                     "output_list": {
                         "type": "array",
                         "description": "URIs (expressed as a URN or URL) of the output files for each tool.",
                         "items": {
-                            "$ref": "2791object.json#/definitions/uri"
-                        }
-                    }
-                }
-            }
-        }
-    }
+                            "$ref": "2791object.json#/definitions/uri",
+                        },
+                    },
+                },
+            },
+        },
+    },
 }
-"""
 
-EXECUTION_DOMAIN = """The Execution domain specifies information needed for deployment, software configuration,
-and running applications in a dependent environment. The JSON schema is as follows:
-{
+EXECUTION_OVERVIEW = """The Execution domain specifies information needed for deployment, software configuration,
+and running applications in a dependent environment. """
+
+EXECUTION_SCHEMA = {
     "$schema": "http://json-schema.org/draft-07/schema#",
     "$id": "https://w3id.org/ieee/ieee-2791-schema/execution_domain.json",
     "type": "object",
@@ -265,21 +268,21 @@ and running applications in a dependent environment. The JSON schema is as follo
         "script_driver",
         "software_prerequisites",
         "external_data_endpoints",
-        "environment_variables"
+        "environment_variables",
     ],
-    "additionalProperties": false,
+    "additionalProperties": False,
     "properties": {
         "script": {
             "type": "array",
             "description": "points to a script object or objects that was used to perform computations for this IEEE-2791 Object instance.",
             "items": {
-                "additionalProperties": false,
+                "additionalProperties": False,
                 "properties": {
                     "uri": {
-                        "$ref": "2791object.json#/definitions/uri"
-                    }
-                }
-			}
+                        "$ref": "2791object.json#/definitions/uri",
+                    },
+                },
+            },
         },
         "script_driver": {
             "type": "string",
@@ -287,8 +290,8 @@ and running applications in a dependent environment. The JSON schema is as follo
             "examples": [
                 "hive",
                 "cwl-runner",
-                "shell"
-            ]
+                "shell",
+            ],
         },
         "software_prerequisites": {
             "type": "array",
@@ -299,29 +302,29 @@ and running applications in a dependent environment. The JSON schema is as follo
                 "required": [
                     "name",
                     "version",
-                    "uri"
+                    "uri",
                 ],
-                "additionalProperties": false,
+                "additionalProperties": False,
                 "properties": {
                     "name": {
                         "type": "string",
                         "description": "Names of software prerequisites",
                         "examples": [
-                            "HIVE-hexagon"
-                        ]
+                            "HIVE-hexagon",
+                        ],
                     },
                     "version": {
                         "type": "string",
                         "description": "Versions of the software prerequisites",
                         "examples": [
-                            "babajanian.1"
-                        ]
+                            "babajanian.1",
+                        ],
                     },
                     "uri": {
-                        "$ref": "2791object.json#/definitions/uri"
-                    }
-                }
-            }
+                        "$ref": "2791object.json#/definitions/uri",
+                    },
+                },
+            },
         },
         "external_data_endpoints": {
             "type": "array",
@@ -331,110 +334,345 @@ and running applications in a dependent environment. The JSON schema is as follo
                 "description": "Requirement for network protocol endpoints used by a pipeline’s scripts, or other software.",
                 "required": [
                     "name",
-                    "url"
+                    "url",
                 ],
-                "additionalProperties": false,
+                "additionalProperties": False,
                 "properties": {
                     "name": {
                         "type": "string",
                         "description": "Description of the service that is accessed",
                         "examples": [
                             "HIVE",
-                            "access to e-utils"
-                        ]
+                            "access to e-utils",
+                        ],
                     },
                     "url": {
                         "type": "string",
                         "description": "The endpoint to be accessed.",
                         "examples": [
-                            "https://hive.biochemistry.gwu.edu/dna.cgi?cmd=login"
-                        ]
-                    }
-                }
-            }
+                            "https://hive.biochemistry.gwu.edu/dna.cgi?cmd=login",
+                        ],
+                    },
+                },
+            },
         },
         "environment_variables": {
             "type": "object",
             "description": "Environmental parameters that are useful to configure the execution environment on the target platform.",
-            "additionalProperties": false,
+            "additionalProperties": False,
             "patternProperties": {
                 "^[a-zA-Z_]+[a-zA-Z0-9_]*$": {
-                    "type": "string"
-                }
-            }
-        }
-    }
+                    "type": "string",
+                },
+            },
+        },
+    },
 }
-"""
 
-PARAMETRIC_DOMAIN = """The parametric domain represents a list of parameters customizing the computational flow which can affect the output of the calculations. These fields can be custom to each kind of analysis andn are tied to a particular pipeline implementation. This domain as a whole is optional so if there is no information in the paper that fits this domain then you can indicate that to the user. The JSON schema is as follows:
-{
+PARAMETRIC_OVERVIEW = """The parametric domain represents a list of parameters customizing the computational flow which can affect the output of the calculations. These fields can be custom to each kind of analysis andn are tied to a particular pipeline implementation. This domain as a whole is optional so if there is no information in the paper that fits this domain then you can indicate that to the user. """
+
+PARAMETRIC_SCHEMA = {
     "$schema": "http://json-schema.org/draft-07/schema#",
     "$id": "https://w3id.org/ieee/ieee-2791-schema/parametric_domain.json",
     "type": "array",
     "title": "Parametric Domain",
     "description": "This represents the list of NON-default parameters customizing the computational flow which can affect the output of the calculations. These fields can be custom to each kind of analysis and are tied to a particular pipeline implementation",
-    "items":{
+    "items": {
         "required": [
             "param",
             "value",
-            "step"
+            "step",
         ],
-        "additionalProperties": false,
+        "additionalProperties": False,
         "properties": {
             "param": {
                 "type": "string",
                 "title": "param",
                 "description": "Specific variables for the computational workflow",
                 "examples": [
-                    "seed"
-                ]
+                    "seed",
+                ],
             },
             "value": {
                 "type": "string",
                 "description": "Specific (non-default) parameter values for the computational workflow",
                 "title": "value",
                 "examples": [
-                    "14"
-                ]
+                    "14",
+                ],
             },
             "step": {
                 "type": "string",
                 "title": "step",
                 "description": "Refers to the specific step of the workflow relevant to the parameters specified in 'param' and 'value'",
                 "examples": [
-                    "1"
+                    "1",
                 ],
-                "pattern": "^(.*)$"
-            }
-        }
-    }
+                "pattern": "^(.*)$",
+            },
+        },
+    },
 }
-"""
 
-ERROR_DOMAIN = """The error domain can be used to determine what range of input returns and outputs are within the tolerance level defined in this subdomain and therefore can be used to optimize the algorithm. It consists of two subdomains: empirical and algorithmic. The empirical error subdomain contains empirically determined values such as limits of detectability, false positives, false negatives, statistical confidence of outcomes, etc. The algorithmic subdomain is descriptive of errors that originate by the fuzziness of the algorithms. This domain as a whole is optional so if there is no information in the paper that fits this domain then you can indicate that to the user. The JSON schema is as follows:
-{
+ERROR_OVERVIEW = """The error domain can be used to determine what range of input returns and outputs are within the tolerance level defined in this subdomain and therefore can be used to optimize the algorithm. It consists of two subdomains: empirical and algorithmic. The empirical error subdomain contains empirically determined values such as limits of detectability, false positives, false negatives, statistical confidence of outcomes, etc. The algorithmic subdomain is descriptive of errors that originate by the fuzziness of the algorithms. This domain as a whole is optional so if there is no information in the paper that fits this domain then you can indicate that to the user. """
+
+ERROR_SCHEMA = {
     "$schema": "http://json-schema.org/draft-07/schema#",
     "$id": "https://w3id.org/2791/error_domain.json",
     "type": "object",
     "title": "Error Domain",
     "description": "Fields in the Error Domain are open-ended and not restricted nor defined by the IEEE-2791 standard. It is RECOMMENDED that the keys directly under empirical_error and algorithmic_error use a full URI. Resolving the URI SHOULD give a JSON Schema or textual definition of the field. Other keys are not allowed error_domain",
-    "additionalProperties": false,
+    "additionalProperties": False,
     "required": [
         "empirical_error",
-        "algorithmic_error"
+        "algorithmic_error",
     ],
     "properties": {
         "empirical_error": {
             "type": "object",
             "title": "Empirical Error",
-            "description": "empirically determined values such as limits of detectability, false positives, false negatives, statistical confidence of outcomes, etc. This can be measured by running the algorithm on multiple data samples of the usability domain or through the use of carefully designed in-silico data."
+            "description": "empirically determined values such as limits of detectability, false positives, false negatives, statistical confidence of outcomes, etc. This can be measured by running the algorithm on multiple data samples of the usability domain or through the use of carefully designed in-silico data.",
         },
         "algorithmic_error": {
             "type": "object",
             "title": "Algorithmic Error",
-            "description": "descriptive of errors that originate by fuzziness of the algorithms, driven by stochastic processes, in dynamically parallelized multi-threaded executions, or in machine learning methodologies where the state of the machine can affect the outcome."
-        }
-    }
+            "description": "descriptive of errors that originate by fuzziness of the algorithms, driven by stochastic processes, in dynamically parallelized multi-threaded executions, or in machine learning methodologies where the state of the machine can affect the outcome.",
+        },
+    },
 }
-"""
+
+SCHEMA_HEADER = "The JSON schema is as follows:"
+
+DOMAINS = {
+    "usability": (USABILITY_OVERVIEW, USABILITY_SCHEMA),
+    "io": (IO_OVERVIEW, IO_SCHEMA),
+    "description": (DESCRIPTION_OVERVIEW, DESCRIPTION_SCHEMA),
+    "execution": (EXECUTION_OVERVIEW, EXECUTION_SCHEMA),
+    "parametric": (PARAMETRIC_OVERVIEW, PARAMETRIC_SCHEMA),
+    "error": (ERROR_OVERVIEW, ERROR_SCHEMA),
+}
+
+# Targets of the domain schemas' external $refs, from the IEEE 2791 object
+# schema, so responses can be validated offline.
+SCHEMA_DEFINITIONS = {
+    "2791object.json#/definitions/uri": {
+        "type": "object",
+        "description": "Any of the four Resource Identifers defined at https://tools.ietf.org/html/draft-handrews-json-schema-validation-01#section-7.3.5",
+        "additionalProperties": False,
+        "required": [
+            "uri",
+        ],
+        "properties": {
+            "filename": {
+                "type": "string",
+            },
+            "uri": {
+                "type": "string",
+                "format": "uri",
+            },
+            "access_time": {
+                "type": "string",
+                "description": "Time stamp of when the request for this data was submitted",
+                "format": "date-time",
+            },
+            "sha1_checksum": {
+                "type": "string",
+                "description": "output of hash function that produces a message digest",
+                "pattern": "[A-Za-z0-9]+",
+            },
+        },
+    },
+}
+
+# Focused prompts for fixing a response that failed schema validation, so
+# only the failing part is regenerated instead of the whole domain.
+REPAIR_PART_PROMPT = """Context from the paper:
+{context}
+
+In a BioCompute Object {label} domain, the field `{path}` failed JSON schema validation: {errors}.
+Its current value is: {value}
+Using the context, return only a corrected JSON value for this one field, with no explanation. It must be valid against this JSON schema: {schema}"""
+
+REPAIR_JSON_PROMPT = """The following BioCompute Object {label} domain was supposed to be JSON but failed validation: {errors}.
+{text}
+Return only the corrected JSON, keeping all of its content, with no explanation. It must be valid against this JSON schema: {schema}"""
+
+# Short queries used only to retrieve chunks. The schema stays in the synthesis
+# prompt so retrieval isn't pulled toward JSON-Schema-looking text.
+DOMAIN_RETRIEVAL_QUERIES = {
+    "usability": "Purpose, aims and scientific motivation of the study and what the analysis workflow was used to find.",
+    "io": "Input data files, datasets, accession numbers, reference genomes and databases used, and the output files produced.",
+    "description": "Computational pipeline steps in order, the tools or software used in each step, and each step's inputs and outputs.",
+    "execution": "Software, scripts, code repositories, versions, dependencies and the compute environment used to run the analysis.",
+    "parametric": "Non-default parameters, settings, thresholds and command line options used by the tools in the analysis.",
+    "error": "Error rates, limits of detection, false positives and negatives, statistical confidence and accuracy of the results.",
+}
+
+# Vocabulary BM25 matches chunks on for the hybrid retrieval domains. Exact
+# identifiers (file formats, accession prefixes, tool names, flags) are what
+# an embedding of the retrieval query tends to miss.
+DOMAIN_LEXICAL_QUERIES = {
+    "usability": "aim aims goal purpose objective motivation hypothesis investigate identify",
+    "io": "fastq fasta bam sam cram vcf bed gtf gff csv tsv txt h5ad mzml raw accession "
+    "GEO GSE GSM SRA SRR SRP ENA ERR PRJNA PRJEB ArrayExpress dbGaP EGA Zenodo figshare "
+    "GRCh37 GRCh38 hg19 hg38 mm10 GRCm39 Ensembl RefSeq GENCODE UniProt PDB dataset "
+    "download deposited input output",
+    "description": "pipeline workflow step steps aligned mapped trimmed filtered "
+    "normalized quantified annotated called merged",
+    "execution": "github gitlab bitbucket zenodo version v python R perl java bash conda "
+    "bioconda docker singularity snakemake nextflow cwl galaxy CRAN Bioconductor pip "
+    "script scripts package cluster server GPU CPU cores memory HPC",
+    "parametric": "parameter parameters default option options flag threshold cutoff "
+    "setting settings minimum maximum length quality score p-value FDR k-mer",
+    "error": "error rate accuracy precision recall sensitivity specificity false positive "
+    "negative FDR confidence interval limit detection validation",
+}
+
+# Domains whose generated output is given to a domain as context. The chunks
+# those domains were generated from are left out of its retrieved context.
+DOMAIN_CONTEXT_SOURCES = {
+    "io": ("description",),
+    "execution": ("description",),
+    "parametric": ("description",),
+}
+
+PRIOR_DOMAINS_PROMPT = """These domains were already extracted from the same paper. Stay consistent with them, and use them in place of the paper text they were extracted from:
+{context}"""
+
+# Paper sections each domain's retrieval searches. "body" is text before the
+# first recognised heading, so papers without headings are searched whole.
+DOMAIN_SECTIONS = {
+    "usability": ("body", "abstract", "introduction", "discussion"),
+    "io": ("body", "methods", "results", "data_availability", "supplementary"),
+    "description": ("body", "abstract", "methods", "results"),
+    "execution": ("body", "methods", "data_availability", "supplementary"),
+    "parametric": ("body", "methods", "supplementary"),
+    "error": ("body", "methods", "results", "discussion", "supplementary"),
+}
+
+# Retrieval and synthesis policy per domain. Up to max_chunks are retrieved,
+# those scoring under score_cutoff times the best are dropped, and the rest
+# go in one call if they fit context_tokens. Past that, domains that allow
+# refine are answered over several calls, the others are cut at the budget.
+DOMAIN_RETRIEVAL_POLICIES = {
+    "usability": {"max_chunks": 3, "score_cutoff": 0.9, "context_tokens": 1200, "refine": False},
+    "io": {"max_chunks": 4, "score_cutoff": 0.8, "context_tokens": 2000, "refine": False},
+    "description": {"max_chunks": 6, "score_cutoff": 0.85, "context_tokens": 4000, "refine": True},
+    "execution": {"max_chunks": 4, "score_cutoff": 0.8, "context_tokens": 3000, "refine": True},
+    "parametric": {"max_chunks": 4, "score_cutoff": 0.8, "context_tokens": 2000, "refine": False},
+    "error": {"max_chunks": 3, "score_cutoff": 0.9, "context_tokens": 1500, "refine": False},
+}
+
+# Prompt token ceilings for the overview plus the compact schema.
+DOMAIN_TOKEN_BUDGETS = {
+    "usability": 200,
+    "io": 320,
+    "description": 800,
+    "execution": 600,
+    "parametric": 280,
+    "error": 360,
+}
+
+# Applied in order until a rendered prompt fits its domain's budget.
+COMPACTION_LEVELS = [
+    {"keep_examples": True, "max_description_chars": None},
+    {"keep_examples": False, "max_description_chars": None},
+    {"keep_examples": False, "max_description_chars": 160},
+    {"keep_examples": False, "max_description_chars": 60},
+    {"keep_examples": False, "max_description_chars": 0},
+]
+
+# Keys whose children are property names rather than schema keywords.
+NAMED_CHILDREN = ("properties", "patternProperties", "definitions")
+
+
+def estimate_tokens(text: str) -> int:
+    return len(text) // 4
+
+
+def strip_schema(
+    value, keep_examples: bool, max_description_chars: int = None, keywords: bool = True
+):
+    if isinstance(value, list):
+        return [
+            strip_schema(item, keep_examples, max_description_chars) for item in value
+        ]
+    if not isinstance(value, dict):
+        return value
+
+    stripped = {}
+    for key, item in value.items():
+        if keywords:
+            if key in ("$schema", "$id", "$comment", "title"):
+                continue
+            if key == "examples" and not keep_examples:
+                continue
+            if key == "description" and isinstance(item, str):
+                if max_description_chars == 0:
+                    continue
+                if max_description_chars and len(item) > max_description_chars:
+                    item = item[:max_description_chars].rstrip() + "..."
+                stripped[key] = item
+                continue
+        stripped[key] = strip_schema(
+            item,
+            keep_examples,
+            max_description_chars,
+            keywords=not (keywords and key in NAMED_CHILDREN),
+        )
+    return stripped
+
+
+def render_full_prompt(domain: str) -> str:
+    overview, schema = DOMAINS[domain]
+    return f"{overview}{SCHEMA_HEADER}\n{json.dumps(schema, indent=4, ensure_ascii=False)}\n"
+
+
+def render_compact_prompt(
+    domain: str, count_tokens=estimate_tokens, budget: int = None
+) -> str:
+    overview, schema = DOMAINS[domain]
+    overview = " ".join(overview.split())
+    budget = budget or DOMAIN_TOKEN_BUDGETS[domain]
+    for level in COMPACTION_LEVELS:
+        rendered_schema = json.dumps(
+            strip_schema(schema, **level), separators=(",", ":"), ensure_ascii=False
+        )
+        prompt = f"{overview} {SCHEMA_HEADER} {rendered_schema}"
+        if count_tokens(prompt) <= budget:
+            break
+    return prompt
+
+
+def prompt_token_report(count_tokens=estimate_tokens) -> list:
+    return [
+        {
+            "domain": domain,
+            "full": count_tokens(render_full_prompt(domain)),
+            "compact": count_tokens(render_compact_prompt(domain, count_tokens)),
+            "budget": DOMAIN_TOKEN_BUDGETS[domain],
+        }
+        for domain in DOMAINS
+    ]
+
+
+USABILITY_DOMAIN = render_full_prompt("usability")
+IO_DOMAIN = render_full_prompt("io")
+DESCRIPTION_DOMAIN = render_full_prompt("description")
+EXECUTION_DOMAIN = render_full_prompt("execution")
+PARAMETRIC_DOMAIN = render_full_prompt("parametric")
+ERROR_DOMAIN = render_full_prompt("error")
+
+
+if __name__ == "__main__":
+    import tiktoken
+    from pipeline import llm_model_name
+
+    encoder = tiktoken.encoding_for_model(llm_model_name)
+    rows = prompt_token_report(lambda text: len(encoder.encode(text)))
+    print(f"{'domain':<12}{'full':>8}{'compact':>10}{'budget':>8}{'saved':>8}")
+    for row in rows:
+        saved = 1 - row["compact"] / row["full"]
+        print(
+            f"{row['domain']:<12}{row['full']:>8}{row['compact']:>10}{row['budget']:>8}{saved:>8.0%}"
+        )
@@ -0,0 +1,219 @@
+import json
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import httpx
+
+max_api_retries = int(os.getenv("OPENAI_MAX_RETRIES", "6"))
+retry_base_delay = float(os.getenv("OPENAI_RETRY_BASE_DELAY", "0.5"))
+retry_max_delay = float(os.getenv("OPENAI_RETRY_MAX_DELAY", "30"))
+# Reserved for a chat completion's output when the request has no max_tokens.
+default_completion_tokens = int(os.getenv("OPENAI_COMPLETION_TOKEN_ESTIMATE", "1000"))
+
+
+class TokenBucket:
+    """Refills continuously, ``per_minute`` units per minute up to a full
+    minute's worth, and blocks in ``acquire`` until enough are available."""
+
+    def __init__(self, per_minute: float):
+        self.capacity = float(per_minute)
+        self._available = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._available = min(
+            self.capacity,
+            self._available + (now - self._updated) * self.capacity / 60,
+        )
+        self._updated = now
+
+    def acquire(self, amount: float):
+        # A request bigger than the whole bucket only waits for a full one.
+        amount = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                self._refill()
+                if self._available >= amount:
+                    self._available -= amount
+                    return
+                wait = (amount - self._available) * 60 / self.capacity
+            time.sleep(wait)
+
+    def drain(self):
+        # The server says the budget is spent whatever our estimate thinks.
+        with self._lock:
+            self._refill()
+            self._available = 0.0
+
+
+class AdaptiveConcurrency:
+    """Concurrency limit adjusted from feedback, additive increase and
+    multiplicative decrease. 429s halve it, as do responses slower than
+    ``target_latency`` if one is set."""
+
+    def __init__(
+        self, initial: int, maximum: int, target_latency: Optional[float] = None
+    ):
+        self.limit = float(initial)
+        self.maximum = maximum
+        self.target_latency = target_latency
+        self._active = 0
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        with self._condition:
+            while self._active >= int(self.limit):
+                self._condition.wait()
+            self._active += 1
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False):
+        with self._condition:
+            self._active -= 1
+            slow = (
+                self.target_latency is not None
+                and latency is not None
+                and latency > self.target_latency
+            )
+            if throttled or slow:
+                self.limit = max(1.0, self.limit / 2)
+            elif latency is not None:
+                self.limit = min(float(self.maximum), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+class RateLimiter:
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        max_concurrency: int,
+        target_latency: Optional[float] = None,
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(
+            max(1, max_concurrency // 2), max_concurrency, target_latency
+        )
+        self.stats = {"requests": 0, "throttled": 0, "retries": 0}
+
+    def acquire(self, tokens: int):
+        self.requests.acquire(1)
+        self.tokens.acquire(tokens)
+        self.concurrency.acquire()
+
+    def release(self, latency: Optional[float] = None, throttled: bool = False):
+        self.concurrency.release(latency, throttled)
+        self.stats["requests"] += 1
+        if throttled:
+            self.stats["throttled"] += 1
+            self.requests.drain()
+            self.tokens.drain()
+
+
+def limiter_from_env(prefix: str, rpm: int, tpm: int, concurrency: int, latency=None):
+    latency = os.getenv(f"{prefix}_TARGET_LATENCY", latency)
+    return RateLimiter(
+        float(os.getenv(f"{prefix}_RPM", str(rpm))),
+        float(os.getenv(f"{prefix}_TPM", str(tpm))),
+        int(os.getenv(f"{prefix}_MAX_CONCURRENCY", str(concurrency))),
+        float(latency) if latency is not None else None,
+    )
+
+
+def retry_delay(response: Optional[httpx.Response], attempt: int) -> float:
+    if response is not None:
+        try:
+            return float(response.headers["retry-after"])
+        except (KeyError, ValueError):
+            pass
+    # Full jitter, so throttled clients don't retry in lockstep.
+    return random.uniform(0, min(retry_max_delay, retry_base_delay * 2**attempt))
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """httpx transport shared by the OpenAI embedding and LLM clients.
+
+    Requests wait for the matching limiter's request and token buckets and a
+    concurrency slot. 429s and 5xx responses are retried with jittered
+    backoff and fed back into the limiter. The SDK clients should be created
+    with ``max_retries=0`` so they don't retry on top of this.
+    """
+
+    def __init__(
+        self,
+        limiters: Dict[str, RateLimiter],
+        count_tokens: Callable[[str], int],
+        max_retries: int = max_api_retries,
+        transport: httpx.BaseTransport = None,
+    ):
+        self.limiters = limiters
+        self.count_tokens = count_tokens
+        self.max_retries = max_retries
+        self._transport = transport or httpx.HTTPTransport()
+
+    def limiter_for(self, request: httpx.Request) -> Optional[RateLimiter]:
+        for path_suffix, limiter in self.limiters.items():
+            if request.url.path.endswith(path_suffix):
+                return limiter
+        return None
+
+    def estimate_tokens(self, request: httpx.Request) -> int:
+        try:
+            body = json.loads(request.read() or b"{}")
+        except ValueError:
+            return 1
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        tokens = sum(
+            self.count_tokens(item) if isinstance(item, str) else len(item)
+            for item in inputs
+        )
+        for message in body.get("messages", []):
+            content = message.get("content")
+            tokens += 4 + (self.count_tokens(content) if isinstance(content, str) else 0)
+        if "messages" in body or "prompt" in body:
+            tokens += body.get("max_tokens") or default_completion_tokens
+        return max(tokens, 1)
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        limiter = self.limiter_for(request)
+        if limiter is None:
+            return self._transport.handle_request(request)
+
+        tokens = self.estimate_tokens(request)
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire(tokens)
+            started = time.monotonic()
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError:
+                limiter.release()
+                if attempt == self.max_retries:
+                    raise
+                limiter.stats["retries"] += 1
+                time.sleep(retry_delay(None, attempt))
+                continue
+
+            throttled = response.status_code == 429
+            if not throttled and response.status_code < 500:
+                # Streamed responses free their slot once headers arrive.
+                limiter.release(latency=time.monotonic() - started)
+                return response
+
+            limiter.release(throttled=throttled)
+            if attempt == self.max_retries:
+                return response
+            response.read()
+            response.close()
+            limiter.stats["retries"] += 1
+            time.sleep(retry_delay(response, attempt))
+
+    def close(self):
+        self._transport.close()
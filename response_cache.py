@@ -0,0 +1,120 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+response_cache_path = os.getenv("RESPONSE_CACHE_PATH", "./response_cache.sqlite3")
+response_cache_ttl = float(os.getenv("RESPONSE_CACHE_TTL", str(7 * 24 * 60 * 60)))
+response_cache_max_entries = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "5000"))
+
+
+def response_key(
+    document_key: str, domain: str, prompt: str, llm_model: str, retrieval_settings: dict
+) -> str:
+    payload = json.dumps(
+        {
+            "document": document_key,
+            "domain": domain,
+            "prompt": hashlib.sha256(prompt.encode("utf-8")).hexdigest(),
+            "llm_model": llm_model,
+            "retrieval": retrieval_settings,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+
+    def __init__(
+        self,
+        path: str = response_cache_path,
+        ttl: float = response_cache_ttl,
+        max_entries: int = response_cache_max_entries,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._inflight = {}
+        self._inflight_lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )"""
+        )
+        self._connection.commit()
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT response, created FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.ttl:
+                self._connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self._connection.commit()
+                return None
+            self._connection.execute(
+                "UPDATE responses SET last_used = ? WHERE key = ?", (now, key)
+            )
+            self._connection.commit()
+        return row[0]
+
+    def put(self, key: str, response: str):
+        now = time.time()
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO responses (key, response, created, last_used) VALUES (?, ?, ?, ?)",
+                (key, response, now, now),
+            )
+            self._connection.execute(
+                "DELETE FROM responses WHERE created < ?", (now - self.ttl,)
+            )
+            self._connection.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_used DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,),
+            )
+            self._connection.commit()
+
+    def get_or_compute(self, key: str, compute, refresh: bool = False):
+        """Return ``(response, from_cache)``, calling ``compute`` at most once
+        per key at a time; concurrent callers wait for the leader's result."""
+        if not refresh:
+            cached = self.get(key)
+            if cached is not None:
+                return cached, True
+
+        while True:
+            with self._inflight_lock:
+                event = self._inflight.get(key)
+                leader = event is None
+                if leader:
+                    event = threading.Event()
+                    self._inflight[key] = event
+            if leader:
+                break
+            event.wait()
+            cached = self.get(key)
+            if cached is not None:
+                return cached, True
+            # The leader failed, so try to take over the call.
+
+        try:
+            response = compute()
+            self.put(key, response)
+            return response, False
+        finally:
+            with self._inflight_lock:
+                self._inflight.pop(key, None)
+            event.set()
@@ -0,0 +1,80 @@
+import threading
+import weakref
+from typing import Callable, Iterable, List
+
+from llama_index.core import Settings
+from llama_index.core.retrievers import BaseRetriever
+from llama_index.core.schema import NodeWithScore, QueryBundle
+
+
+class RetrievalPlan:
+    """Every domain's retrieval for one document, run together.
+
+    Each node is fetched once however many domains retrieved it, and each
+    domain keeps its own ranked slice of node ids into the shared union.
+    """
+
+    def __init__(self, retrieve: Callable[[str], List[NodeWithScore]], domains: Iterable[str]):
+        self.nodes = {}
+        self.slices = {}
+        for domain in domains:
+            results = retrieve(domain)
+            for result in results:
+                self.nodes.setdefault(result.node.node_id, result.node)
+            self.slices[domain] = [(result.node.node_id, result.score) for result in results]
+
+    def slice(self, domain: str, exclude: Iterable[str] = ()) -> List[NodeWithScore]:
+        """The domain's nodes, minus ``exclude`` unless that would leave none."""
+        exclude = set(exclude)
+        ranked = self.slices[domain]
+        kept = [(node_id, score) for node_id, score in ranked if node_id not in exclude]
+        return [
+            NodeWithScore(node=self.nodes[node_id], score=score)
+            for node_id, score in kept or ranked
+        ]
+
+    def node_ids(self, domains: Iterable[str]) -> set:
+        return {node_id for domain in domains for node_id, _ in self.slices.get(domain, [])}
+
+    def stats(self) -> dict:
+        return {
+            "unique_chunks": len(self.nodes),
+            "domain_chunks": sum(len(ranked) for ranked in self.slices.values()),
+        }
+
+
+class PlannedRetriever(BaseRetriever):
+    """Serves nodes already chosen from a ``RetrievalPlan`` to a query engine."""
+
+    def __init__(self, nodes: List[NodeWithScore]):
+        self._nodes = nodes
+        super().__init__(callback_manager=Settings.callback_manager)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        return list(self._nodes)
+
+
+class RetrievalPlans:
+    """One plan per loaded index, built on first use and dropped with the
+    index when the registry evicts it."""
+
+    def __init__(self):
+        self._plans = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self._build_locks = weakref.WeakKeyDictionary()
+
+    def get(self, index, build: Callable[[], RetrievalPlan]) -> RetrievalPlan:
+        with self._lock:
+            plan = self._plans.get(index)
+            if plan is not None:
+                return plan
+            build_lock = self._build_locks.setdefault(index, threading.Lock())
+        # Domains of the same document generated at once share one build.
+        with build_lock:
+            with self._lock:
+                plan = self._plans.get(index)
+            if plan is None:
+                plan = build()
+                with self._lock:
+                    self._plans[index] = plan
+            return plan
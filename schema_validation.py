@@ -0,0 +1,110 @@
+import re
+from typing import List
+
+json_types = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool,
+    "null": type(None),
+}
+
+
+def type_matches(value, expected) -> bool:
+    if isinstance(expected, list):
+        return any(type_matches(value, option) for option in expected)
+    if expected in ("number", "integer"):
+        if isinstance(value, bool) or not isinstance(value, (int, float)):
+            return False
+        return expected == "number" or float(value).is_integer()
+    return isinstance(value, json_types.get(expected, object))
+
+
+def json_type(value) -> str:
+    for name, python_type in json_types.items():
+        if isinstance(value, python_type):
+            return name
+    return "number"
+
+
+def validate(value, schema: dict, definitions: dict = None, path: tuple = ()) -> List[dict]:
+    """Validate ``value`` against the draft-07 keywords the BCO domain schemas
+    use, returning ``{"path", "keyword", "message"}`` errors.
+
+    ``$ref``s are looked up in ``definitions`` by their literal value, since
+    the domain schemas point at a 2791object.json that isn't shipped. As in
+    draft-07 itself, ``format`` is treated as an annotation only.
+    """
+    definitions = definitions or {}
+    if "$ref" in schema:
+        if schema["$ref"] not in definitions:
+            return []
+        schema = definitions[schema["$ref"]]
+
+    def error(keyword: str, message: str, at: tuple = path) -> dict:
+        return {"path": at, "keyword": keyword, "message": message}
+
+    expected = schema.get("type")
+    if expected is not None and not type_matches(value, expected):
+        return [error("type", f"expected {expected}, got {json_type(value)}")]
+
+    errors = []
+    if "enum" in schema and value not in schema["enum"]:
+        errors.append(error("enum", f"must be one of {schema['enum']}"))
+    if isinstance(value, str) and "pattern" in schema:
+        if not re.search(schema["pattern"], value):
+            errors.append(error("pattern", f"must match {schema['pattern']}"))
+
+    if isinstance(value, dict):
+        for name in schema.get("required", []):
+            if name not in value:
+                errors.append(error("required", "is required", path + (name,)))
+        properties = schema.get("properties", {})
+        pattern_properties = schema.get("patternProperties", {})
+        for name, item in value.items():
+            matched = False
+            if name in properties:
+                matched = True
+                errors += validate(item, properties[name], definitions, path + (name,))
+            for pattern, item_schema in pattern_properties.items():
+                if re.search(pattern, name):
+                    matched = True
+                    errors += validate(item, item_schema, definitions, path + (name,))
+            additional = schema.get("additionalProperties", True)
+            if not matched and additional is False:
+                errors.append(error("additionalProperties", "is not allowed", path + (name,)))
+            elif not matched and isinstance(additional, dict):
+                errors += validate(item, additional, definitions, path + (name,))
+
+    if isinstance(value, list) and isinstance(schema.get("items"), dict):
+        for position, item in enumerate(value):
+            errors += validate(item, schema["items"], definitions, path + (position,))
+
+    return errors
+
+
+def subschema(schema: dict, path: tuple, definitions: dict = None) -> dict:
+    """The schema that applies to the value at ``path``."""
+    definitions = definitions or {}
+    for step in path:
+        schema = definitions.get(schema.get("$ref"), schema)
+        if isinstance(step, int):
+            schema = schema.get("items", {})
+            continue
+        if step in schema.get("properties", {}):
+            schema = schema["properties"][step]
+            continue
+        for pattern, item_schema in schema.get("patternProperties", {}).items():
+            if re.search(pattern, step):
+                schema = item_schema
+                break
+        else:
+            additional = schema.get("additionalProperties", True)
+            schema = additional if isinstance(additional, dict) else {}
+    return definitions.get(schema.get("$ref"), schema)
+
+
+def format_path(path: tuple) -> str:
+    return "".join(
+        f"[{step}]" if isinstance(step, int) else f".{step}" for step in path
+    ).lstrip(".")
@@ -0,0 +1,90 @@
+import re
+from typing import List
+
+from llama_index.core import Document
+
+# Canonical section for each heading spelling, checked in order.
+section_headings = [
+    ("abstract", r"abstract|summary"),
+    ("introduction", r"introduction|background"),
+    (
+        "methods",
+        r"(materials and |experimental )?methods?|methodology|experimental procedures"
+        r"|materials and methods|online methods|star methods",
+    ),
+    ("results", r"results( and discussion)?"),
+    ("discussion", r"discussion|conclusions?"),
+    (
+        "data_availability",
+        r"(data|code|software)( and (data|code|software))? availability"
+        r"|availability of (data|code)( and materials)?|accession (numbers|codes)",
+    ),
+    ("supplementary", r"supplementary( information| materials?| data| methods)?|supporting information"),
+    ("references", r"references|bibliography|literature cited"),
+    (
+        "back_matter",
+        r"acknowledge?ments?|funding|author contributions|competing interests"
+        r"|conflicts? of interest|declarations?",
+    ),
+]
+heading_pattern = re.compile(
+    r"^\s*(?:[0-9]+(?:\.[0-9]+)*\.?|[IVX]+\.)?\s*(?P<title>[A-Za-z][A-Za-z ]{2,60}?)\s*:?\s*$"
+)
+# Text before the first recognised heading, or from papers without any.
+default_section = "body"
+
+
+def heading_section(line: str):
+    match = heading_pattern.match(line)
+    if match is None:
+        return None
+    title = " ".join(match.group("title").lower().split())
+    for section, pattern in section_headings:
+        if re.fullmatch(pattern, title):
+            return section
+    return None
+
+
+class SectionSplitter:
+    """Splits a paper's page Documents into per section Documents, carrying
+    the current section across pages, and drops the references.
+
+    Pages must be passed in order, one ``split`` call per page.
+    """
+
+    def __init__(self, total_pages: int = None, dropped_sections=("references",)):
+        self.total_pages = total_pages
+        self.dropped_sections = dropped_sections
+        self.section = default_section
+        self._page_number = 0
+
+    def _accept(self, section: str) -> bool:
+        # A "References" line in the first half of a paper is more likely a
+        # table or a sentence fragment than the start of the bibliography.
+        if section == "references" and self.total_pages:
+            return self._page_number >= self.total_pages // 2
+        return True
+
+    def split(self, document: Document) -> List[Document]:
+        segments = [(self.section, [])]
+        for line in document.text.splitlines():
+            section = heading_section(line)
+            if section is not None and self._accept(section):
+                self.section = section
+                segments.append((section, []))
+            segments[-1][1].append(line)
+        self._page_number += 1
+
+        documents = []
+        for position, (section, lines) in enumerate(segments):
+            text = "\n".join(lines).strip()
+            if not text or section in self.dropped_sections:
+                continue
+            documents.append(
+                Document(
+                    doc_id=f"{document.doc_id}-{position}",
+                    text=text,
+                    metadata={**document.metadata, "section": section},
+                )
+            )
+        return documents
@@ -0,0 +1,56 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from bm25 import BM25Index, tokenize
+
+
+def test_tokenize_keeps_identifiers_and_their_pieces():
+    assert tokenize("Aligned with samtools 1.9 to GRCh38.") == [
+        "aligned",
+        "with",
+        "samtools",
+        "1.9",
+        "1",
+        "9",
+        "to",
+        "grch38",
+    ]
+    assert tokenize("reads.fastq.gz") == ["reads.fastq.gz", "reads", "fastq", "gz"]
+
+
+def test_scores_rank_exact_identifiers_first():
+    index = BM25Index()
+    index.add(
+        [
+            "Reads were aligned with samtools 1.9 against GRCh38.",
+            "We thank the sequencing core for samtools support and funding.",
+            "The study aims to characterise tumour evolution.",
+        ]
+    )
+    scores = index.scores("samtools GRCh38")
+    assert scores.argmax() == 0
+    assert scores[1] > 0
+    assert scores[2] == 0
+
+
+def test_keep_and_add_rebuild_postings():
+    index = BM25Index()
+    index.add(["alpha beta", "gamma delta"])
+    assert index.scores("gamma")[1] > 0
+    index.keep([1])
+    assert list(index.scores("gamma") > 0) == [True]
+    index.add(["gamma epsilon"])
+    assert len(index.scores("epsilon")) == 2
+    assert index.scores("epsilon")[1] > 0
+
+
+def test_rows_round_trip():
+    index = BM25Index()
+    index.add(["samtools view", "bwa mem"])
+    restored = BM25Index(rows=index.rows)
+    assert list(restored.scores("bwa")) == list(index.scores("bwa"))
+
+
+def test_empty_index():
+    assert len(BM25Index().scores("anything")) == 0
@@ -0,0 +1,55 @@
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("llama_index.core")
+
+from llama_index.core import Document
+
+from boilerplate import DocumentCleaner
+
+
+def make_page(number: int, body: list) -> Document:
+    lines = ["Journal of Examples 2021", "", *body, "", str(number)]
+    return Document(text="\n".join(lines))
+
+
+def test_repeated_edge_lines_removed_body_numbers_kept():
+    cleaner = DocumentCleaner(count_tokens=lambda text: len(text.split()))
+    topics = ["alignment", "calling", "filtering", "annotation", "plotting"]
+    pages = [
+        make_page(
+            number,
+            [
+                f"This page covers {topic}.",
+                f"Methods for {topic} follow.",
+                "Table 1",
+                str(number + 10),
+                f"Results of {topic}.",
+                f"End of {topic}.",
+            ],
+        )
+        for number, topic in enumerate(topics, start=1)
+    ]
+    cleaned = cleaner.clean_pages(pages)
+
+    for number, page in enumerate(cleaned, start=1):
+        lines = page.text.splitlines()
+        assert "Journal of Examples 2021" not in lines
+        assert str(number) not in lines
+        # A bare number in the body normalizes like the page numbers do, but
+        # is a table cell and must survive.
+        assert str(number + 10) in lines
+    assert cleaner.report["lines_removed"] == 10
+
+
+def test_dedupe_nodes_drops_exact_duplicates():
+    from llama_index.core.schema import TextNode
+
+    cleaner = DocumentCleaner(count_tokens=lambda text: len(text.split()))
+    nodes = [
+        TextNode(id_="a", text="Reads were aligned with samtools."),
+        TextNode(id_="b", text="Reads  were aligned with samtools."),
+        TextNode(id_="c", text="Data is deposited in GEO."),
+    ]
+    assert [node.node_id for node in cleaner.dedupe_nodes(nodes)] == ["a", "c"]
+    assert cleaner.report["chunks_removed"] == 1
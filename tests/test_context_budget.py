@@ -0,0 +1,58 @@
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from context_budget import select_context
+
+
+def results(*scored):
+    return [
+        NodeWithScore(node=TextNode(id_=f"n{position}", text=" ".join(["word"] * words)), score=score)
+        for position, (score, words) in enumerate(scored)
+    ]
+
+
+def count_words(text: str) -> int:
+    return len(text.split())
+
+
+def node_ids(selection: dict) -> list:
+    return [result.node.node_id for result in selection["nodes"]]
+
+
+def test_low_scores_are_cut_relative_to_the_best():
+    selection = select_context(results((0.9, 10), (0.8, 10), (0.3, 10)), 100, 0.5, False, count_words)
+    assert node_ids(selection) == ["n0", "n1"]
+    assert selection == {**selection, "mode": "compact", "context_tokens": 20}
+
+
+def test_no_cutoff_keeps_every_result():
+    selection = select_context(results((0.03, 10), (0.01, 10)), 100, None, False, count_words)
+    assert node_ids(selection) == ["n0", "n1"]
+
+
+def test_over_budget_is_packed_or_refined():
+    scored = results((0.9, 60), (0.8, 60), (0.7, 60))
+    packed = select_context(scored, 130, 0.1, False, count_words)
+    assert node_ids(packed) == ["n0", "n1"]
+    assert packed["mode"] == "compact"
+    assert packed["context_tokens"] == 120
+
+    refined = select_context(scored, 130, 0.1, True, count_words)
+    assert node_ids(refined) == ["n0", "n1", "n2"]
+    assert refined["mode"] == "refine"
+
+
+def test_best_result_always_goes_in():
+    selection = select_context(results((0.9, 200)), 50, 0.5, False, count_words)
+    assert node_ids(selection) == ["n0"]
+
+
+def test_no_results():
+    assert select_context([], 100, 0.5, False, count_words) == {
+        "nodes": [],
+        "mode": "compact",
+        "context_tokens": 0,
+    }
@@ -0,0 +1,17 @@
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from hybrid_retrieval import reciprocal_rank_fusion
+
+
+def test_chunks_found_by_both_rankings_come_first():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["c", "d"]], k=60)
+    assert [node_id for node_id, _ in fused] == ["c", "a", "b", "d"]
+    scores = dict(fused)
+    assert scores["c"] == pytest.approx(1 / 63 + 1 / 61)
+    assert scores["a"] == pytest.approx(1 / 61)
+
+
+def test_empty_rankings():
+    assert reciprocal_rank_fusion([[], []]) == []
@@ -0,0 +1,35 @@
+import json
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("llama_index.core")
+
+import index_cache
+
+
+@pytest.fixture
+def entry(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_cache, "cache_directory", str(tmp_path))
+    path = index_cache.entry_path("key")
+    os.makedirs(path)
+    with open(os.path.join(path, index_cache.entry_metadata_file), "w") as f:
+        json.dump({"key": "key", "files": ["/data/a.pdf"]}, f)
+    return path
+
+
+def test_register_source_replaces_metadata(entry):
+    index_cache.register_source("key", "/data/b.pdf")
+    index_cache.register_source("key", "/data/b.pdf")
+    assert index_cache.read_entry_metadata("key")["files"] == ["/data/a.pdf", "/data/b.pdf"]
+    assert os.listdir(entry) == [index_cache.entry_metadata_file]
+
+
+def test_register_source_skips_unreadable_metadata(entry):
+    metadata_path = os.path.join(entry, index_cache.entry_metadata_file)
+    with open(metadata_path, "w") as f:
+        f.write('{"key": "ke')
+    index_cache.register_source("key", "/data/b.pdf")
+    with open(metadata_path) as f:
+        assert f.read() == '{"key": "ke'
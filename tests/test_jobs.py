@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from jobs import JobQueue
+
+
+def wait(job, timeout: float = 5):
+    # A job's future resolves after it has released its dependents.
+    job.future.result(timeout=timeout)
+
+
+def test_dependent_job_waits_without_holding_a_worker():
+    queue = JobQueue(workers=2)
+    release = threading.Event()
+    order = []
+
+    def source(job):
+        release.wait(5)
+        order.append("source")
+
+    def dependent(job):
+        order.append("dependent")
+
+    source_job = queue.submit("domain", source, domain="description")
+    dependent_job = queue.submit("domain", dependent, after=[source_job], domain="io")
+    assert dependent_job.status == "queued"
+    assert dependent_job.waiting_for == [source_job]
+    assert dependent_job.future is None
+
+    # The second worker is still free for other work.
+    other = queue.submit("domain", lambda job: order.append("other"), domain="usability")
+    wait(other)
+    assert order == ["other"]
+
+    release.set()
+    wait(source_job)
+    wait(dependent_job)
+    assert order == ["other", "source", "dependent"]
+    assert dependent_job.status == "done"
+
+
+def test_dependent_job_runs_after_a_failed_source():
+    queue = JobQueue(workers=1)
+
+    def source(job):
+        raise RuntimeError("no credit")
+
+    source_job = queue.submit("domain", source, domain="description")
+    dependent_job = queue.submit("domain", lambda job: "ok", after=[source_job], domain="io")
+    wait(source_job)
+    wait(dependent_job)
+    assert source_job.status == "failed"
+    assert dependent_job.result == "ok"
+
+
+def test_cancel_waiting_job():
+    queue = JobQueue(workers=1)
+    release = threading.Event()
+    source_job = queue.submit("domain", lambda job: release.wait(5), domain="description")
+    dependent_job = queue.submit("domain", lambda job: "ok", after=[source_job], domain="io")
+
+    queue.cancel(dependent_job.id)
+    assert dependent_job.status == "cancelled"
+    release.set()
+    wait(source_job)
+    assert dependent_job.future is None
@@ -0,0 +1,139 @@
+import threading
+import time
+
+import pytest
+
+httpx = pytest.importorskip("httpx")
+pytest.importorskip("tiktoken")
+
+from openai_stand_in import make_server
+from rate_limit import AdaptiveConcurrency, RateLimitedTransport, RateLimiter, TokenBucket
+
+
+@pytest.fixture
+def stand_in():
+    # One LLM request per half-second window, answered at once.
+    server = make_server(
+        port=0,
+        llm_rpm=1,
+        llm_tpm=1000000,
+        llm_latency=0.0,
+        completion_words=5,
+        window_seconds=0.5,
+    )
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def chat(client: httpx.Client, base_url: str) -> httpx.Response:
+    return client.post(
+        f"{base_url}/v1/chat/completions",
+        json={"model": "gpt-4", "messages": [{"role": "user", "content": "hi"}], "max_tokens": 10},
+    )
+
+
+def test_429_is_retried_after_retry_after(stand_in):
+    limiter = RateLimiter(60000, 10000000, 4)
+    transport = RateLimitedTransport(
+        {"/chat/completions": limiter}, lambda text: len(text.split()), max_retries=3
+    )
+    base_url = f"http://127.0.0.1:{stand_in.server_address[1]}"
+    with httpx.Client(transport=transport) as client:
+        assert chat(client, base_url).status_code == 200
+        started = time.monotonic()
+        response = chat(client, base_url)
+        waited = time.monotonic() - started
+
+    assert response.status_code == 200
+    throttled = stand_in.llm_window.stats["throttled"]
+    assert stand_in.llm_window.stats["served"] == 2
+    assert throttled >= 1
+    assert limiter.stats["throttled"] == throttled
+    assert limiter.stats["retries"] == throttled
+    # The stand-in asks for the rest of its window, and the retry honours it.
+    assert waited >= 0.3
+
+
+def test_429_is_returned_once_retries_run_out(stand_in):
+    limiter = RateLimiter(60000, 10000000, 4)
+    transport = RateLimitedTransport(
+        {"/chat/completions": limiter}, lambda text: len(text.split()), max_retries=0
+    )
+    base_url = f"http://127.0.0.1:{stand_in.server_address[1]}"
+    with httpx.Client(transport=transport) as client:
+        chat(client, base_url)
+        response = chat(client, base_url)
+    assert response.status_code == 429
+    assert float(response.headers["retry-after"]) > 0
+    assert limiter.stats["retries"] == 0
+
+
+def test_token_bucket_blocks_until_refilled():
+    bucket = TokenBucket(per_minute=60000)
+    started = time.monotonic()
+    bucket.acquire(60000)
+    assert time.monotonic() - started < 0.1
+    # 500 more tokens take half a second to refill at 1000 a second.
+    bucket.acquire(500)
+    assert time.monotonic() - started >= 0.4
+
+
+def test_token_bucket_drain():
+    bucket = TokenBucket(per_minute=60000)
+    bucket.drain()
+    started = time.monotonic()
+    bucket.acquire(200)
+    assert time.monotonic() - started >= 0.15
+
+
+def test_concurrency_halves_on_throttle_and_grows_on_success():
+    concurrency = AdaptiveConcurrency(initial=8, maximum=8)
+    concurrency.acquire()
+    concurrency.release(throttled=True)
+    assert concurrency.limit == 4
+    # Additive increase: about one step per limit's worth of successes.
+    for _ in range(4):
+        concurrency.acquire()
+        concurrency.release(latency=0.1)
+    assert 4 < concurrency.limit < 5
+    for _ in range(100):
+        concurrency.acquire()
+        concurrency.release(latency=0.1)
+    assert concurrency.limit == 8
+
+    for _ in range(10):
+        concurrency.acquire()
+        concurrency.release(throttled=True)
+    assert concurrency.limit == 1
+
+
+def test_concurrency_halves_on_slow_responses():
+    concurrency = AdaptiveConcurrency(initial=4, maximum=4, target_latency=1.0)
+    concurrency.acquire()
+    concurrency.release(latency=2.0)
+    assert concurrency.limit == 2
+    for _ in range(100):
+        concurrency.acquire()
+        concurrency.release(latency=0.1)
+    assert concurrency.limit == 4
+
+
+def test_concurrency_limit_blocks_extra_callers():
+    concurrency = AdaptiveConcurrency(initial=1, maximum=1)
+    concurrency.acquire()
+    entered = threading.Event()
+
+    def second():
+        concurrency.acquire()
+        entered.set()
+        concurrency.release()
+
+    thread = threading.Thread(target=second)
+    thread.start()
+    assert not entered.wait(0.2)
+    concurrency.release()
+    assert entered.wait(2)
+    thread.join()
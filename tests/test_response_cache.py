@@ -0,0 +1,94 @@
+import threading
+import time
+
+import pytest
+
+from response_cache import ResponseCache, response_key
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return ResponseCache(path=str(tmp_path / "responses.sqlite3"))
+
+
+def test_response_key_changes_with_inputs():
+    key = response_key("doc", "io", "prompt", "gpt-4", {"top_k": 5})
+    assert key == response_key("doc", "io", "prompt", "gpt-4", {"top_k": 5})
+    assert key != response_key("doc", "io", "prompt", "gpt-4", {"top_k": 6})
+    assert key != response_key("doc", "io", "other prompt", "gpt-4", {"top_k": 5})
+
+
+def test_get_or_compute_caches(cache):
+    assert cache.get_or_compute("key", lambda: "first") == ("first", False)
+    assert cache.get_or_compute("key", lambda: "second") == ("first", True)
+    assert cache.get_or_compute("key", lambda: "third", refresh=True) == ("third", False)
+    assert cache.get("key") == "third"
+
+
+def test_concurrent_callers_share_one_compute(cache):
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)
+        return "response"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(cache.get_or_compute("key", compute)))
+        for _ in range(5)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(calls) == 1
+    assert sorted(results) == [("response", False)] + [("response", True)] * 4
+
+
+def test_follower_takes_over_when_the_leader_fails(cache):
+    leader_running = threading.Event()
+
+    def failing():
+        leader_running.set()
+        time.sleep(0.1)
+        raise RuntimeError("timed out")
+
+    errors = []
+
+    def leader():
+        try:
+            cache.get_or_compute("key", failing)
+        except RuntimeError as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=leader)
+    thread.start()
+    leader_running.wait(2)
+    assert cache.get_or_compute("key", lambda: "recovered") == ("recovered", False)
+    thread.join()
+    assert len(errors) == 1
+
+
+def test_expired_entries_are_not_served(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "responses.sqlite3"), ttl=0.05)
+    cache.put("key", "response")
+    time.sleep(0.1)
+    assert cache.get("key") is None
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "responses.sqlite3"), max_entries=2)
+    cache.put("a", "1")
+    time.sleep(0.01)
+    cache.put("b", "2")
+    time.sleep(0.01)
+    cache.get("a")
+    time.sleep(0.01)
+    cache.put("c", "3")
+    assert cache.get("b") is None
+    assert cache.get("a") == "1"
+    assert cache.get("c") == "3"
@@ -0,0 +1,78 @@
+from schema_validation import format_path, subschema, validate
+
+definitions = {
+    "uri": {
+        "type": "object",
+        "required": ["uri"],
+        "properties": {"uri": {"type": "string", "format": "uri"}},
+    }
+}
+schema = {
+    "type": "object",
+    "required": ["name", "steps"],
+    "additionalProperties": False,
+    "properties": {
+        "name": {"type": "string", "pattern": "^[A-Z]"},
+        "version": {"type": "integer"},
+        "status": {"enum": ["draft", "final"]},
+        "steps": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"input": {"$ref": "uri"}},
+            },
+        },
+    },
+    "patternProperties": {"^x-": {"type": "string"}},
+}
+
+
+def test_valid_document_has_no_errors():
+    document = {
+        "name": "Pipeline",
+        "version": 2,
+        "status": "final",
+        "steps": [{"input": {"uri": "https://example.org/reads.fastq.gz"}}],
+        "x-note": "extension",
+    }
+    assert validate(document, schema, definitions) == []
+
+
+def test_errors_carry_keyword_and_path():
+    document = {
+        "name": "pipeline",
+        "version": 2.5,
+        "status": "wip",
+        "steps": [{"input": {}}],
+        "x-note": 1,
+        "extra": True,
+    }
+    errors = {(error["keyword"], error["path"]) for error in validate(document, schema, definitions)}
+    assert errors == {
+        ("pattern", ("name",)),
+        ("type", ("version",)),
+        ("enum", ("status",)),
+        ("required", ("steps", 0, "input", "uri")),
+        ("type", ("x-note",)),
+        ("additionalProperties", ("extra",)),
+    }
+
+
+def test_missing_required_and_booleans_are_not_numbers():
+    errors = validate({"version": True}, schema, definitions)
+    assert {error["path"] for error in errors} == {("name",), ("steps",), ("version",)}
+
+
+def test_unknown_ref_is_not_checked():
+    assert validate(42, {"$ref": "missing.json"}) == []
+
+
+def test_subschema_follows_items_refs_and_patterns():
+    assert subschema(schema, ("steps", 0, "input"), definitions) == definitions["uri"]
+    assert subschema(schema, ("x-note",), definitions) == {"type": "string"}
+    assert subschema(schema, ("unknown",), definitions) == {}
+
+
+def test_format_path():
+    assert format_path(("steps", 0, "input", "uri")) == "steps[0].input.uri"
+    assert format_path(()) == ""
@@ -0,0 +1,48 @@
+import pytest
+
+pytest.importorskip("llama_index.core")
+
+from llama_index.core import Document
+
+from sections import SectionSplitter, heading_section
+
+
+@pytest.mark.parametrize(
+    "line, section",
+    [
+        ("Abstract", "abstract"),
+        ("2. Materials and Methods", "methods"),
+        ("III. RESULTS AND DISCUSSION", "results"),
+        ("Data Availability:", "data_availability"),
+        ("References", "references"),
+        ("Acknowledgements", "back_matter"),
+        ("Methods were applied to all samples.", None),
+        ("Table 2", None),
+    ],
+)
+def test_heading_section(line, section):
+    assert heading_section(line) == section
+
+
+def test_sections_carry_across_pages_and_references_are_dropped():
+    splitter = SectionSplitter(total_pages=2)
+    first = splitter.split(
+        Document(doc_id="p1", text="Title\nMethods\nReads were aligned.", metadata={"page": 1})
+    )
+    second = splitter.split(
+        Document(doc_id="p2", text="with bwa mem.\nReferences\n1. Li H. 2009.", metadata={"page": 2})
+    )
+    assert [(document.metadata["section"], document.text) for document in first] == [
+        ("body", "Title"),
+        ("methods", "Methods\nReads were aligned."),
+    ]
+    assert [(document.metadata["section"], document.text) for document in second] == [
+        ("methods", "with bwa mem.")
+    ]
+    assert second[0].metadata["page"] == 2
+
+
+def test_early_references_heading_is_not_trusted():
+    splitter = SectionSplitter(total_pages=10)
+    documents = splitter.split(Document(doc_id="p1", text="Methods\nReferences\nMore methods."))
+    assert [document.metadata["section"] for document in documents] == ["methods"]
@@ -0,0 +1,72 @@
+import os
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("llama_index.core")
+
+from llama_index.core import Settings, StorageContext, VectorStoreIndex
+from llama_index.core.embeddings import MockEmbedding
+from llama_index.core.schema import QueryBundle, TextNode
+from llama_index.core.vector_stores.types import (
+    FilterOperator,
+    MetadataFilter,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+)
+
+import index_cache
+from vector_store import MmapVectorStore, matrix_path, vector_store_file
+
+
+def make_node(node_id: str, text: str, section: str, embedding: list) -> TextNode:
+    return TextNode(id_=node_id, text=text, metadata={"section": section}, embedding=embedding)
+
+
+def test_build_persist_load_filtered_query(tmp_path, monkeypatch):
+    monkeypatch.setattr(index_cache, "cache_directory", str(tmp_path))
+    Settings.embed_model = MockEmbedding(embed_dim=3)
+
+    store = MmapVectorStore()
+    storage_context = StorageContext.from_defaults(vector_store=store)
+    # An empty store must not be swapped for llama-index's default one.
+    assert storage_context.vector_store is store
+    index = VectorStoreIndex(nodes=[], storage_context=storage_context)
+    index.insert_nodes(
+        [
+            make_node("a", "We aligned reads with samtools 1.9", "methods", [1.0, 0.0, 0.0]),
+            make_node("b", "The aim of the study", "introduction", [0.9, 0.1, 0.0]),
+            make_node("c", "Data is deposited in GEO", "data_availability", [0.0, 1.0, 0.0]),
+        ]
+    )
+    index_cache.store_index("key", index)
+
+    entry = index_cache.entry_path("key")
+    assert os.path.exists(matrix_path(os.path.join(entry, vector_store_file)))
+    loaded = index_cache.load_cached_index("key")
+    assert isinstance(loaded.vector_store, MmapVectorStore)
+
+    filters = MetadataFilters(
+        filters=[
+            MetadataFilter(
+                key="section",
+                value=["methods", "data_availability"],
+                operator=FilterOperator.IN,
+            )
+        ]
+    )
+    results = loaded.as_retriever(similarity_top_k=2, filters=filters).retrieve(
+        QueryBundle(query_str="query", embedding=[1.0, 0.0, 0.0])
+    )
+    assert [result.node.node_id for result in results] == ["a", "c"]
+
+    sparse = loaded.vector_store.query(
+        VectorStoreQuery(
+            query_str="samtools",
+            mode=VectorStoreQueryMode.SPARSE,
+            similarity_top_k=2,
+            filters=filters,
+        )
+    )
+    assert sparse.ids == ["a"]
@@ -0,0 +1,21 @@
+import threading
+from contextlib import contextmanager
+
+# Kept apart from tracing.py, which imports llama-index, so the job queue
+# can tag its work without loading it.
+_context = threading.local()
+
+
+def current_tags() -> dict:
+    return dict(getattr(_context, "tags", {}))
+
+
+@contextmanager
+def trace_tags(**tags):
+    # Tags are per thread, so concurrent domain workers label their own spans.
+    previous = current_tags()
+    _context.tags = {**previous, **tags}
+    try:
+        yield
+    finally:
+        _context.tags = previous
@@ -0,0 +1,128 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import List
+
+from trace_context import current_tags
+
+max_trace_spans = int(os.getenv("MAX_TRACE_SPANS", "10000"))
+prometheus_textfile = os.getenv("PROMETHEUS_TEXTFILE")
+
+summary_quantiles = (0.5, 0.95, 0.99)
+
+
+def quantile(ordered: List[float], fraction: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class LatencyTracer:
+    """Records a timing span per pipeline stage, from ``span`` blocks and
+    from llama-index's events through ``callbacks.TracingHandler``."""
+
+    def __init__(self, max_spans: int = max_trace_spans):
+        self._lock = threading.Lock()
+        self._export_lock = threading.Lock()
+        self._spans = deque(maxlen=max_spans)
+
+    def record(self, stage: str, duration: float, started_at: float = None, **tags):
+        span = {
+            "stage": stage,
+            "start": started_at if started_at is not None else time.time() - duration,
+            "duration": duration,
+            **current_tags(),
+            **tags,
+        }
+        with self._lock:
+            self._spans.append(span)
+
+    @contextmanager
+    def span(self, stage: str, **tags):
+        started_at = time.time()
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - started, started_at, **tags)
+
+    def spans(self, **tags) -> List[dict]:
+        with self._lock:
+            spans = list(self._spans)
+        return [
+            span
+            for span in spans
+            if all(span.get(key) == value for key, value in tags.items())
+        ]
+
+    def summary(self, **tags) -> List[dict]:
+        durations = {}
+        for span in self.spans(**tags):
+            durations.setdefault(span["stage"], []).append(span["duration"])
+        rows = []
+        for stage, values in sorted(durations.items()):
+            ordered = sorted(values)
+            rows.append(
+                {
+                    "stage": stage,
+                    "count": len(ordered),
+                    "total": sum(ordered),
+                    "p50": quantile(ordered, 0.5),
+                    "p95": quantile(ordered, 0.95),
+                    "max": ordered[-1],
+                }
+            )
+        return rows
+
+    def to_jsonl(self, **tags) -> str:
+        return "".join(json.dumps(span) + "\n" for span in self.spans(**tags))
+
+    def to_prometheus(self) -> str:
+        durations = {}
+        for span in self.spans():
+            durations.setdefault(span["stage"], []).append(span["duration"])
+        lines = [
+            "# HELP bco_stage_duration_seconds Duration of each BCO pipeline stage.",
+            "# TYPE bco_stage_duration_seconds summary",
+        ]
+        for stage, values in sorted(durations.items()):
+            ordered = sorted(values)
+            for fraction in summary_quantiles:
+                lines.append(
+                    f'bco_stage_duration_seconds{{stage="{stage}",quantile="{fraction}"}} {quantile(ordered, fraction):.6f}'
+                )
+            lines.append(f'bco_stage_duration_seconds_sum{{stage="{stage}"}} {sum(ordered):.6f}')
+            lines.append(f'bco_stage_duration_seconds_count{{stage="{stage}"}} {len(ordered)}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus_textfile(self, path: str = prometheus_textfile):
+        # For node_exporter's textfile collector; written atomically.
+        if not path:
+            return
+        # Metrics are best effort, a failed export must not fail the request
+        # that triggered it.
+        try:
+            with self._export_lock:
+                descriptor, temp_path = tempfile.mkstemp(
+                    dir=os.path.dirname(path) or ".", suffix=".tmp"
+                )
+                try:
+                    with os.fdopen(descriptor, "w") as f:
+                        f.write(self.to_prometheus())
+                    os.replace(temp_path, path)
+                except BaseException:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+                    raise
+        except OSError as e:
+            print(f"Could not write {path}: {e}", file=sys.stderr)
+
+
+# One per process, shared by the pipeline and the app, which reads it
+# without loading llama-index.
+tracer = LatencyTracer()
@@ -0,0 +1,337 @@
+import json
+import os
+import threading
+from typing import Any, List, Optional
+
+import numpy as np
+from llama_index.core.bridge.pydantic import PrivateAttr
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.vector_stores.types import (
+    BasePydanticVectorStore,
+    FilterCondition,
+    FilterOperator,
+    MetadataFilters,
+    VectorStoreQuery,
+    VectorStoreQueryMode,
+    VectorStoreQueryResult,
+)
+
+from bm25 import BM25Index
+
+vector_store_dtype = os.getenv("VECTOR_STORE_DTYPE", "float32")
+vector_store_file = "default__vector_store.json"
+supported_dtypes = ("float32", "float16", "int8")
+
+_shared_stores = {}
+_shared_stores_lock = threading.Lock()
+
+
+def matrix_path(persist_path: str) -> str:
+    return os.path.splitext(persist_path)[0] + ".npy"
+
+
+def scales_path(persist_path: str) -> str:
+    return os.path.splitext(persist_path)[0] + ".scales.npy"
+
+
+def bm25_path(persist_path: str) -> str:
+    return os.path.splitext(persist_path)[0] + ".bm25.json"
+
+
+def flat_metadata(metadata: dict) -> dict:
+    # Only scalar values can be filtered on, the rest lives in the docstore.
+    return {
+        key: value
+        for key, value in metadata.items()
+        if isinstance(value, (str, int, float, bool)) or value is None
+    }
+
+
+def quantize(vectors: np.ndarray, dtype: str):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    vectors = vectors / norms
+    if dtype == "int8":
+        scales = np.abs(vectors).max(axis=1)
+        scales[scales == 0] = 1.0
+        quantized = np.round(vectors / scales[:, None] * 127).astype(np.int8)
+        return quantized, (scales / 127).astype(np.float32)
+    return vectors.astype(dtype), None
+
+
+def filter_matches(value, metadata_filter) -> bool:
+    operator = metadata_filter.operator
+    expected = metadata_filter.value
+    if operator == FilterOperator.EQ:
+        return value == expected
+    if operator == FilterOperator.NE:
+        return value != expected
+    if operator == FilterOperator.IN:
+        return value in expected
+    if operator == FilterOperator.NIN:
+        return value not in expected
+    if value is None:
+        return False
+    if operator == FilterOperator.GT:
+        return value > expected
+    if operator == FilterOperator.GTE:
+        return value >= expected
+    if operator == FilterOperator.LT:
+        return value < expected
+    if operator == FilterOperator.LTE:
+        return value <= expected
+    raise ValueError(f"Unsupported metadata filter operator: {operator}")
+
+
+class MmapVectorStore(BasePydanticVectorStore):
+    """Vector store keeping normalized embeddings in one contiguous matrix.
+
+    Persisted stores are loaded with ``np.load(mmap_mode="r")`` so the OS page
+    cache backs the matrix and every session shares the same pages.
+
+    A BM25 index over the same rows answers ``VectorStoreQueryMode.SPARSE``
+    queries on ``query_str``, with the same filters as dense ones.
+    """
+
+    stores_text: bool = False
+    dtype: str = vector_store_dtype
+
+    _ids: List[str] = PrivateAttr(default_factory=list)
+    _ref_doc_ids: List[Optional[str]] = PrivateAttr(default_factory=list)
+    _metadata: List[dict] = PrivateAttr(default_factory=list)
+    _matrix: Optional[np.ndarray] = PrivateAttr(default=None)
+    _scales: Optional[np.ndarray] = PrivateAttr(default=None)
+    _bm25: BM25Index = PrivateAttr(default_factory=BM25Index)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    def __init__(self, dtype: str = vector_store_dtype, **kwargs: Any):
+        if dtype not in supported_dtypes:
+            raise ValueError(f"Unsupported vector store dtype: {dtype}")
+        super().__init__(dtype=dtype, **kwargs)
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "MmapVectorStore"
+
+    @property
+    def client(self) -> Any:
+        return None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    def __bool__(self) -> bool:
+        # StorageContext.from_defaults does ``vector_store or SimpleVectorStore()``,
+        # which would swap out an empty store if it were falsy.
+        return True
+
+    @property
+    def nbytes(self) -> int:
+        total = 0 if self._matrix is None else self._matrix.nbytes
+        if self._scales is not None:
+            total += self._scales.nbytes
+        return total
+
+    def add(self, nodes: List[BaseNode], **add_kwargs: Any) -> List[str]:
+        if not nodes:
+            return []
+        vectors = np.asarray([node.get_embedding() for node in nodes], dtype=np.float32)
+        matrix, scales = quantize(vectors, self.dtype)
+        with self._lock:
+            if self._matrix is None:
+                self._matrix, self._scales = matrix, scales
+            else:
+                # np.concatenate copies, which also detaches a loaded read-only
+                # memmap from its file.
+                self._matrix = np.concatenate([self._matrix, matrix])
+                if scales is not None:
+                    self._scales = np.concatenate([self._scales, scales])
+            self._ids.extend(node.node_id for node in nodes)
+            self._ref_doc_ids.extend(node.ref_doc_id for node in nodes)
+            self._metadata.extend(flat_metadata(node.metadata) for node in nodes)
+            self._bm25.add([node.get_content(metadata_mode=MetadataMode.NONE) for node in nodes])
+        return [node.node_id for node in nodes]
+
+    def delete(self, ref_doc_id: str, **delete_kwargs: Any) -> None:
+        with self._lock:
+            keep = [
+                position
+                for position, row_ref_doc_id in enumerate(self._ref_doc_ids)
+                if row_ref_doc_id != ref_doc_id
+            ]
+            if len(keep) == len(self._ids):
+                return
+            self._matrix = np.ascontiguousarray(self._matrix[keep])
+            if self._scales is not None:
+                self._scales = np.ascontiguousarray(self._scales[keep])
+            self._ids = [self._ids[position] for position in keep]
+            self._ref_doc_ids = [self._ref_doc_ids[position] for position in keep]
+            self._metadata = [self._metadata[position] for position in keep]
+            self._bm25.keep(keep)
+
+    def row_mask(self, query: VectorStoreQuery) -> Optional[np.ndarray]:
+        if not (query.filters or query.doc_ids or query.node_ids):
+            return None
+        mask = np.ones(len(self._ids), dtype=bool)
+        if query.doc_ids:
+            doc_ids = set(query.doc_ids)
+            mask &= np.fromiter(
+                (row in doc_ids for row in self._ref_doc_ids), bool, len(self._ids)
+            )
+        if query.node_ids:
+            node_ids = set(query.node_ids)
+            mask &= np.fromiter((row in node_ids for row in self._ids), bool, len(self._ids))
+        if query.filters:
+            mask &= np.fromiter(
+                (self.metadata_matches(row, query.filters) for row in self._metadata),
+                bool,
+                len(self._ids),
+            )
+        return mask
+
+    def metadata_matches(self, metadata: dict, filters: MetadataFilters) -> bool:
+        results = []
+        for metadata_filter in filters.filters:
+            if isinstance(metadata_filter, MetadataFilters):
+                results.append(self.metadata_matches(metadata, metadata_filter))
+            else:
+                results.append(
+                    filter_matches(metadata.get(metadata_filter.key), metadata_filter)
+                )
+        if filters.condition == FilterCondition.OR:
+            return any(results)
+        return all(results)
+
+    def scores(self, query_embedding: List[float]) -> np.ndarray:
+        query_vector = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query_vector)
+        if norm:
+            query_vector = query_vector / norm
+        # One matrix-vector product scores every row. Quantized rows are
+        # brought back to cosine similarity by their per-row scale.
+        scores = np.asarray(self._matrix @ query_vector, dtype=np.float32)
+        if self._scales is not None:
+            scores *= self._scales
+        return scores
+
+    def sparse_query(self, query: VectorStoreQuery) -> VectorStoreQueryResult:
+        with self._lock:
+            if not self._ids or not query.query_str:
+                return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+            scores = self._bm25.scores(query.query_str)
+            mask = self.row_mask(query)
+            ids = self._ids
+
+        if mask is not None:
+            scores[~mask] = 0.0
+        # Rows sharing no term with the query aren't lexical matches at all.
+        candidates = np.flatnonzero(scores > 0)
+        top = candidates[np.argsort(-scores[candidates], kind="stable")]
+        top = top[: query.sparse_top_k or query.similarity_top_k]
+        return VectorStoreQueryResult(
+            nodes=None,
+            similarities=[float(scores[position]) for position in top],
+            ids=[ids[position] for position in top],
+        )
+
+    def query(self, query: VectorStoreQuery, **kwargs: Any) -> VectorStoreQueryResult:
+        if query.mode == VectorStoreQueryMode.SPARSE:
+            return self.sparse_query(query)
+        with self._lock:
+            if self._matrix is None or not self._ids or query.query_embedding is None:
+                return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+            scores = self.scores(query.query_embedding)
+            mask = self.row_mask(query)
+            ids = self._ids
+
+        if mask is not None:
+            scores = np.where(mask, scores, -np.inf)
+            available = int(mask.sum())
+        else:
+            available = len(scores)
+        top_k = min(query.similarity_top_k, available)
+        if top_k <= 0:
+            return VectorStoreQueryResult(nodes=None, similarities=[], ids=[])
+
+        top = np.argpartition(-scores, top_k - 1)[:top_k]
+        top = top[np.argsort(-scores[top])]
+        return VectorStoreQueryResult(
+            nodes=None,
+            similarities=[float(scores[position]) for position in top],
+            ids=[ids[position] for position in top],
+        )
+
+    def persist(self, persist_path: str, fs: Any = None) -> None:
+        directory = os.path.dirname(persist_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._lock:
+            if self._matrix is not None:
+                np.save(matrix_path(persist_path), np.ascontiguousarray(self._matrix))
+            if self._scales is not None:
+                np.save(scales_path(persist_path), self._scales)
+            with open(bm25_path(persist_path), "w") as f:
+                json.dump(self._bm25.rows, f)
+            with open(persist_path, "w") as f:
+                json.dump(
+                    {
+                        "dtype": self.dtype,
+                        "ids": self._ids,
+                        "ref_doc_ids": self._ref_doc_ids,
+                        "metadata": self._metadata,
+                    },
+                    f,
+                )
+
+    @classmethod
+    def from_persisted(
+        cls,
+        data: dict,
+        matrix: Optional[np.ndarray] = None,
+        scales: Optional[np.ndarray] = None,
+        bm25_rows: Optional[List[dict]] = None,
+    ) -> "MmapVectorStore":
+        store = cls(dtype=data["dtype"])
+        store._ids = data["ids"]
+        store._ref_doc_ids = data["ref_doc_ids"]
+        store._metadata = data["metadata"]
+        store._matrix = matrix
+        store._scales = scales
+        if bm25_rows is not None:
+            store._bm25 = BM25Index(bm25_rows)
+        return store
+
+    @classmethod
+    def from_persist_path(cls, persist_path: str) -> "MmapVectorStore":
+        with open(persist_path) as f:
+            data = json.load(f)
+        matrix = scales = bm25_rows = None
+        if os.path.exists(matrix_path(persist_path)):
+            matrix = np.load(matrix_path(persist_path), mmap_mode="r")
+        if os.path.exists(scales_path(persist_path)):
+            scales = np.load(scales_path(persist_path), mmap_mode="r")
+        if os.path.exists(bm25_path(persist_path)):
+            with open(bm25_path(persist_path)) as f:
+                bm25_rows = json.load(f)
+        return cls.from_persisted(data, matrix, scales, bm25_rows)
+
+    @classmethod
+    def from_persist_dir(cls, persist_dir: str) -> "MmapVectorStore":
+        return cls.from_persist_path(os.path.join(persist_dir, vector_store_file))
+
+
+def shared_vector_store(persist_dir: str) -> MmapVectorStore:
+    # Stores loaded from disk are only read from, so one instance per entry is
+    # shared by every session in the process.
+    path = os.path.realpath(persist_dir)
+    with _shared_stores_lock:
+        store = _shared_stores.get(path)
+        if store is None:
+            store = MmapVectorStore.from_persist_dir(path)
+            _shared_stores[path] = store
+        return store
+
+
+def forget_shared_vector_store(persist_dir: str):
+    with _shared_stores_lock:
+        _shared_stores.pop(os.path.realpath(persist_dir), None)